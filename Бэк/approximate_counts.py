@@ -0,0 +1,214 @@
+import hashlib
+import json
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.db.models.sql import Query
+from django.db.models.sql.where import WhereNode
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.settings import api_settings
+
+from eqator_projects.models import CasePage, UserProject
+from eqator_projects.models.auto_test_runs import AutoTestResults
+
+# до скольких строк считать точно; выше - оценка планировщика или "больше N"
+EXACT_COUNT_LIMIT = getattr(settings, 'PAGINATION_EXACT_COUNT_LIMIT', 10000)
+# массовые операции не шлют сигналы, поэтому кеш ещё и живёт ограниченное время
+COUNT_CACHE_TIMEOUT = getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', 5 * 60)
+
+
+def _version_key(table):
+    return f'count_version:{table}'
+
+
+def bump_table_version(table):
+    try:
+        cache.incr(_version_key(table))
+    except ValueError:
+        cache.set(_version_key(table), 1, None)
+
+
+def _model_tables(model):
+    # у наследников BasePage строки лежат и в таблицах родителей
+    return [model._meta.db_table] + [parent._meta.db_table for parent in model._meta.get_parent_list()]
+
+
+def _bump_on_commit(tables):
+    for table in tables:
+        transaction.on_commit(partial(bump_table_version, table))
+
+
+def bump_model_counts(model):
+    """
+    Явный сброс количеств для массовых операций (update, bulk_update), которые не шлют сигналы.
+    """
+    _bump_on_commit(_model_tables(model))
+
+
+def track_counts(model):
+    """
+    Сбрасывает закешированные количества выборок модели при её изменении и
+    изменении её M2M. Версии увеличиваются после коммита, чтобы параллельный
+    запрос не закешировал количество по данным до изменения.
+    """
+    def model_changed(sender, **kwargs):
+        bump_model_counts(model)
+
+    def m2m_table_changed(sender, action, **kwargs):
+        if action.startswith('post_'):
+            _bump_on_commit([sender._meta.db_table])
+
+    post_save.connect(model_changed, sender=model, weak=False)
+    post_delete.connect(model_changed, sender=model, weak=False)
+    for field in model._meta.many_to_many:
+        m2m_changed.connect(m2m_table_changed, sender=field.remote_field.through, weak=False)
+
+
+# модели списков с ApproximateCountPagination и таблицы подзапросов их фильтров (права участников)
+track_counts(CasePage)
+track_counts(AutoTestResults)
+track_counts(UserProject)
+
+
+def _query_tables(query, tables):
+    """
+    Таблицы запроса вместе с подзапросами в фильтрах и аннотациях (EXISTS по тегам, права ABAC).
+    """
+    tables.update(join.table_name for join in query.alias_map.values())
+    pending = [query.where, *query.annotations.values()]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, Query):
+            _query_tables(node, tables)
+        elif isinstance(node, WhereNode):
+            pending.extend(node.children)
+        elif hasattr(node, 'get_source_expressions'):
+            pending.extend(source for source in node.get_source_expressions() if source is not None)
+    return tables
+
+
+def _count_key(queryset):
+    """
+    Ключ по SQL выборки (фильтры, поиск, права) и версиям всех таблиц, которые в нём участвуют.
+    """
+    query = queryset.order_by().query
+    sql, params = query.sql_with_params()
+    tables = sorted(_query_tables(query, {queryset.model._meta.db_table}))
+    versions = cache.get_many([_version_key(table) for table in tables])
+    raw = json.dumps([queryset.db, sql, params, versions], default=str, sort_keys=True)
+    return f'paginator_count:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def planner_estimate(queryset):
+    """
+    Оценка количества строк планировщиком PostgreSQL, без выполнения запроса.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_count(queryset, limit=None):
+    """
+    Количество строк выборки и признак точности, с кешем по (фильтрам, версии данных).
+    Точно считается не больше limit строк (COUNT по подзапросу с LIMIT), для
+    больших выборок берётся оценка планировщика, но не меньше limit.
+    """
+    limit = EXACT_COUNT_LIMIT if limit is None else limit
+    key = _count_key(queryset)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    count = queryset.order_by()[:limit + 1].count()
+    exact = count <= limit
+    if not exact:
+        count = max(planner_estimate(queryset) or 0, limit)
+    cache.set(key, (count, exact), COUNT_CACHE_TIMEOUT)
+    return count, exact
+
+
+class ApproximatePage(Page):
+    """
+    Страница при приблизительном количестве: есть ли следующая, известно по
+    лишней строке выборки, а не по num_pages - строки за оценкой иначе недостижимы.
+    """
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CachedCountPaginator(Paginator):
+    count_exact = True
+
+    @cached_property
+    def count(self):
+        count, self.count_exact = get_count(self.object_list)
+        return count
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_exact:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        return self.page_from_rows(list(self.object_list[bottom:bottom + self.per_page + 1]), number)
+
+    def page_from_rows(self, rows, number):
+        """
+        Страница по уже выбранным строкам; rows может содержать одну лишнюю строку.
+        """
+        if self.count_exact:
+            return Page(rows[:self.per_page], number, self)
+        return ApproximatePage(rows[:self.per_page], number, self, has_next=len(rows) > self.per_page)
+
+    def validate_number(self, number):
+        self.count  # count_exact выставляется вместе с количеством
+        if self.count_exact:
+            return super().validate_number(number)
+        # при приблизительном количестве дальние страницы не отсекаются, они просто окажутся пустыми
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_('That page number is not an integer'))
+        if number < 1:
+            raise EmptyPage(_('That page number is less than 1'))
+        return number
+
+
+BasePagination = api_settings.DEFAULT_PAGINATION_CLASS or PageNumberPagination
+
+
+class ApproximateCountPagination(BasePagination):
+    """
+    Пагинация с кешируемым и, для больших выборок, приблизительным count.
+    В ответе count_exact - точное ли количество.
+    """
+    django_paginator_class = CachedCountPaginator
+    page_size_query_param = getattr(BasePagination, 'page_size_query_param', None) or 'page_size'
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['count_exact'] = getattr(self.page.paginator, 'count_exact', True)
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['count_exact'] = {'type': 'boolean', 'example': True}
+        return schema
@@ -0,0 +1,174 @@
+import asyncio
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.paginator import InvalidPage, Page
+from django.db import close_old_connections, connections
+from django.http import Http404
+from django.utils.decorators import classonlymethod
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+from eqator_projects.services.approximate_counts import CachedCountPaginator, get_count
+
+# считать количество строк параллельно с запросом страницы, на отдельном соединении
+ASYNC_PARALLEL_COUNT = getattr(settings, 'ASYNC_PARALLEL_COUNT', True)
+
+
+def _in_atomic_block(alias):
+    return connections[alias].in_atomic_block
+
+
+def _count(queryset, approximate):
+    return get_count(queryset) if approximate else (queryset.count(), True)
+
+
+def _count_on_own_connection(queryset, approximate):
+    # соединение потока пула живёт по CONN_MAX_AGE, как соединение потока запроса
+    close_old_connections()
+    return _count(queryset, approximate)
+
+
+async def acount(queryset, approximate=False):
+    """
+    Количество строк выборки и признак точности (approximate - через get_count
+    с кешем и оценкой). Вне транзакции выполняется в отдельном потоке со своим
+    соединением и не ждёт остальные запросы запроса; внутри транзакции (тесты,
+    atomic) - на общем соединении, иначе не будут видны незакоммиченные строки.
+    """
+    if ASYNC_PARALLEL_COUNT and not await sync_to_async(_in_atomic_block)(queryset.db):
+        return await sync_to_async(_count_on_own_connection, thread_sensitive=False)(queryset, approximate)
+    if approximate:
+        return await sync_to_async(get_count)(queryset)
+    return await queryset.acount(), True
+
+
+async def afetch(queryset, offset=0, limit=None):
+    """
+    Строки выборки списком. Через list() в потоке, а не aiterator(): до Django 5.0
+    aiterator() не поддерживает prefetch_related.
+    """
+    if limit is not None:
+        queryset = queryset[offset:offset + limit]
+    return await sync_to_async(list)(queryset)
+
+
+class AsyncReadViewSetMixin:
+    """
+    Асинхронные обработчики во вьюсете. Если хотя бы одно действие маршрута
+    объявлено через async def, вьюха маршрута становится асинхронной (под ASGI
+    не занимает поток на время запросов к БД), синхронные действия того же
+    маршрута выполняются через sync_to_async.
+    """
+
+    @classonlymethod
+    def as_view(cls, actions=None, **initkwargs):
+        # привязку действий к методам делает ViewSetMixin.as_view, вьюха лишь
+        # помечается асинхронной - её результатом будет корутина из dispatch
+        view = super().as_view(actions, **initkwargs)
+        if any(iscoroutinefunction(getattr(cls, name, None)) for name in view.actions.values()):
+            markcoroutinefunction(view)
+        return view
+
+    def _is_async_route(self):
+        return any(iscoroutinefunction(getattr(self, action, None)) for action in self.action_map.values())
+
+    def dispatch(self, request, *args, **kwargs):
+        if self._is_async_route():
+            return self.adispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """
+        APIView.dispatch для асинхронной вьюхи: те же шаги через публичные
+        методы APIView, синхронные из них - в потоке.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = await sync_to_async(self.handle_exception)(exc)
+
+        self.response = await sync_to_async(self.finalize_response)(request, response, *args, **kwargs)
+        return self.response
+
+    async def aget_object(self):
+        queryset = await sync_to_async(lambda: self.filter_queryset(self.get_queryset()))()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = await queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}).afirst()
+        if obj is None:
+            raise Http404
+        await sync_to_async(self.check_object_permissions)(self.request, obj)
+        return obj
+
+    async def aserializer_data(self, instance, many=False):
+        serializer = self.get_serializer(instance, many=many)
+        # поля сериализатора могут ходить в БД
+        return await sync_to_async(lambda: serializer.data)()
+
+    async def apaginate_queryset(self, queryset):
+        """
+        Асинхронный paginate_queryset: страница и COUNT запрашиваются одновременно.
+        """
+        paginator = self.paginator
+        if not isinstance(paginator, PageNumberPagination):
+            return await sync_to_async(self.paginate_queryset)(queryset)
+        page_size = paginator.get_page_size(self.request)
+        if not page_size:
+            return None
+
+        django_paginator = paginator.django_paginator_class(queryset, page_size)
+        approximate = isinstance(django_paginator, CachedCountPaginator)
+        # при приблизительном количестве лишняя строка показывает, есть ли следующая страница
+        limit = page_size + 1 if approximate else page_size
+        page_number = self.request.query_params.get(paginator.page_query_param) or 1
+        if page_number in paginator.last_page_strings:
+            django_paginator.count, django_paginator.count_exact = await acount(queryset, approximate)
+            page_number = django_paginator.num_pages
+            offset = (page_number - 1) * page_size
+            rows = await afetch(queryset, offset, limit)
+        else:
+            try:
+                offset = max(int(page_number) - 1, 0) * page_size
+            except (TypeError, ValueError):
+                offset = 0
+            (django_paginator.count, django_paginator.count_exact), rows = await asyncio.gather(
+                acount(queryset, approximate), afetch(queryset, offset, limit)
+            )
+
+        try:
+            page_number = django_paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(paginator.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        if (page_number - 1) * page_size != offset:
+            rows = await afetch(queryset, (page_number - 1) * page_size, limit)
+
+        if approximate:
+            paginator.page = django_paginator.page_from_rows(rows, page_number)
+        else:
+            paginator.page = Page(rows, page_number, django_paginator)
+        if django_paginator.num_pages > 1 and paginator.template is not None:
+            paginator.display_page_controls = True
+        paginator.request = self.request
+        return list(paginator.page)
+
+    async def alist_response(self, queryset):
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(await self.aserializer_data(page, many=True))
+        return Response(await self.aserializer_data(await afetch(queryset), many=True))
+
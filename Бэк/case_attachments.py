@@ -0,0 +1,128 @@
+from django.core.files.storage import default_storage
+from django.db import models
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+from rest_framework import serializers
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from content.serializers.attachment import AttachmentSerializer
+from eqator_projects.models import CasePage, CaseRun
+from eqator_projects.services.approximate_counts import bump_model_counts
+
+MAX_ATTACHMENTS_BATCH = 100
+
+
+class CaseAttachmentsSummaryMixin(models.Model):
+    """
+    Сводка вложений кейса для списков: количество и превью первого файла.
+    """
+    attachments_count = models.PositiveIntegerField(verbose_name=_('Количество вложений'), default=0)
+    attachments_preview = models.CharField(verbose_name=_('Превью первого вложения'), max_length=1024,
+                                           blank=True, default='')
+
+    class Meta:
+        abstract = True
+
+
+def update_attachments_summary(case_ids):
+    cases = CasePage.objects.filter(id__in=set(case_ids)).prefetch_related('attachments')
+    for case in cases:
+        attachments = sorted(case.attachments.all(), key=lambda attachment: attachment.pk)
+        case.attachments_count = len(attachments)
+        case.attachments_preview = attachments[0].file.name if attachments else ''
+    CasePage.objects.bulk_update(cases, ['attachments_count', 'attachments_preview'])
+    bump_model_counts(CasePage)
+
+
+attachments_field = CasePage._meta.get_field('attachments')
+Attachment = attachments_field.related_model
+
+
+def _attachment_case_ids(attachment_id):
+    through = attachments_field.remote_field.through
+    return set(through.objects.filter(**{f'{attachments_field.m2m_reverse_field_name()}_id': attachment_id})
+               .values_list(f'{attachments_field.m2m_field_name()}_id', flat=True))
+
+
+@receiver(m2m_changed, sender=attachments_field.remote_field.through)
+def case_attachments_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            update_attachments_summary([instance.pk])
+        return
+    # со стороны вложения затронутые кейсы в pk_set, а post_clear приходит
+    # без него - кейсы запоминаются до очистки
+    if action == 'pre_clear':
+        instance._summary_case_ids = _attachment_case_ids(instance.pk)
+    elif action == 'post_clear':
+        update_attachments_summary(getattr(instance, '_summary_case_ids', ()))
+    elif action in ('post_add', 'post_remove'):
+        update_attachments_summary(pk_set or ())
+
+
+@receiver(pre_delete, sender=Attachment)
+def attachment_pre_delete(sender, instance, **kwargs):
+    # связи с кейсами удаляются каскадом без m2m_changed
+    instance._summary_case_ids = _attachment_case_ids(instance.pk)
+
+
+@receiver(post_delete, sender=Attachment)
+def attachment_deleted(sender, instance, **kwargs):
+    update_attachments_summary(getattr(instance, '_summary_case_ids', ()))
+
+
+def attachment_url(request, name, context):
+    """
+    URL файла хранилища, вычисляется один раз на запрос (подпись/stat у хранилища дорогие).
+    """
+    urls = context.setdefault('attachment_urls', {})
+    if name not in urls:
+        url = default_storage.url(name)
+        urls[name] = request.build_absolute_uri(url) if request else url
+    return urls[name]
+
+
+class AttachmentsSummarySerializer(serializers.Serializer):
+    count = serializers.IntegerField(source='case.attachments_count')
+    preview = serializers.SerializerMethodField()
+
+    def get_preview(self, obj):
+        name = obj.case.attachments_preview
+        if not name:
+            return None
+        return attachment_url(self.context.get('request'), name, self.context)
+
+
+class MemoizedAttachmentSerializer(AttachmentSerializer):
+    """
+    Одно и то же вложение в рамках запроса сериализуется один раз.
+    """
+
+    def to_representation(self, instance):
+        cache = self.context.setdefault('attachment_data', {})
+        if instance.pk not in cache:
+            cache[instance.pk] = super().to_representation(instance)
+        return cache[instance.pk]
+
+
+class CaseRunAttachmentsMixin:
+    """
+    Полные вложения прогонов кейсов пачкой - запрашиваются при открытии кейса.
+    """
+
+    @extend_schema(parameters=[OpenApiParameter(name='case_runs', type=int, many=True)])
+    @action(methods=['GET'], detail=True, filterset_class=None, search_fields=None)
+    def attachments(self, request, pk, *args, **kwargs):
+        run = self.get_object()
+        case_run_ids = [int(item) for item in request.query_params.getlist('case_runs') if item.isdigit()]
+        case_runs = CaseRun.objects.filter(run=run, id__in=case_run_ids[:MAX_ATTACHMENTS_BATCH]) \
+            .select_related('case').prefetch_related('case__attachments')
+
+        context = self.get_serializer_context()
+        return Response({
+            case_run.id: MemoizedAttachmentSerializer(case_run.case.attachments.all(), many=True, context=context).data
+            for case_run in case_runs
+        })
@@ -0,0 +1,167 @@
+from django.db import transaction
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+
+from app.celery import app as celery_app
+from eqator_projects.models import CasePage
+from eqator_projects.services.approximate_counts import bump_model_counts
+from eqator_projects.services.project_cache import bump_project_version
+
+# шаг между соседними кейсами после перенумерации
+SORT_GAP = 1024
+# если после перемещения зазор меньше, сьют перенумеровывается в фоне
+SORT_MIN_GAP = 2
+
+
+def suite_cases(project_id, suite_id):
+    return CasePage.objects.filter(project_id=project_id, suite_id=suite_id)
+
+
+def _following(queryset, case):
+    return queryset.filter(Q(sort__gt=case.sort) | Q(sort=case.sort, id__gt=case.id)).order_by('sort', 'id')
+
+
+def _preceding(queryset, case):
+    return queryset.filter(Q(sort__lt=case.sort) | Q(sort=case.sort, id__lt=case.id)).order_by('-sort', '-id')
+
+
+def next_case(queryset, case):
+    return _following(queryset, case).first()
+
+
+def prev_case(queryset, case):
+    return _preceding(queryset, case).first()
+
+
+async def anext_case(queryset, case):
+    return await _following(queryset, case).afirst()
+
+
+async def aprev_case(queryset, case):
+    return await _preceding(queryset, case).afirst()
+
+
+def rebalance_suite(project_id, suite_id):
+    """
+    Перенумеровывает сьют с шагом SORT_GAP, порядок (sort, id) сохраняется.
+    """
+    cases = list(suite_cases(project_id, suite_id).order_by('sort', 'id').only('id', 'sort'))
+    changed = []
+    for index, case in enumerate(cases, start=1):
+        if case.sort != index * SORT_GAP:
+            case.sort = index * SORT_GAP
+            changed.append(case)
+    CasePage.objects.bulk_update(changed, ['sort'], batch_size=1000)
+    bump_project_version(project_id)
+    bump_model_counts(CasePage)
+    return len(changed)
+
+
+@celery_app.task
+def rebalance_suite_task(project_id, suite_id):
+    with transaction.atomic():
+        return rebalance_suite(project_id, suite_id)
+
+
+def _bounds(project_id, suite_id, after, before, moving_ids):
+    others = suite_cases(project_id, suite_id).exclude(id__in=moving_ids)
+    if after is not None:
+        following = next_case(others, after)
+        return after.sort, following.sort if following else None
+    if before is not None:
+        preceding = prev_case(others, before)
+        return preceding.sort if preceding else None, before.sort
+
+
+def _keys_between(low, high, count):
+    if high is None:
+        return [(low or 0) + SORT_GAP * i for i in range(1, count + 1)]
+    # перед первым кейсом сьюта ключи не уходят ниже нуля
+    low = low or 0
+    step = (high - low) // (count + 1)
+    if step < 1:
+        return None
+    return [low + step * i for i in range(1, count + 1)]
+
+
+def _renumber_with_block(project_id, suite_id, cases, after, before):
+    """
+    Перенумеровывает сьют с шагом SORT_GAP, сразу вставляя блок перемещаемых
+    кейсов на место - для блока, который не помещается в зазор между соседями.
+    """
+    moving_ids = [case.id for case in cases]
+    others = list(suite_cases(project_id, suite_id).exclude(id__in=moving_ids)
+                  .order_by('sort', 'id').only('id', 'sort', 'suite'))
+    anchor_ids = [case.id for case in others]
+    position = anchor_ids.index(after.id) + 1 if after is not None else anchor_ids.index(before.id)
+
+    changed = []
+    for index, case in enumerate(others[:position] + list(cases) + others[position:], start=1):
+        if case.id in moving_ids or case.sort != index * SORT_GAP:
+            case.sort = index * SORT_GAP
+            case.suite_id = suite_id
+            changed.append(case)
+    CasePage.objects.bulk_update(changed, ['sort', 'suite'], batch_size=1000)
+
+
+@transaction.atomic
+def move_cases(cases, after=None, before=None):
+    """
+    Ставит блок кейсов (в переданном порядке) после after или перед before в сьюте
+    соседнего кейса. Пишутся только перемещаемые строки; если места в зазоре
+    не хватило, сьют перенумеровывается сразу вместе с блоком, если осталось
+    мало - в фоне.
+    """
+    anchor = after or before
+    project_id, suite_id = anchor.project_id, anchor.suite_id
+    moving_ids = [case.id for case in cases]
+
+    low, high = _bounds(project_id, suite_id, after, before, moving_ids)
+    keys = _keys_between(low, high, len(cases))
+    if keys is None:
+        _renumber_with_block(project_id, suite_id, cases, after, before)
+        bump_project_version(project_id)
+        bump_model_counts(CasePage)
+        return cases
+
+    for case, key in zip(cases, keys):
+        case.sort = key
+        case.suite_id = suite_id
+    CasePage.objects.bulk_update(cases, ['sort', 'suite'])
+    bump_project_version(project_id)
+    bump_model_counts(CasePage)
+
+    # зазоры с обеих сторон блока и внутри него: перенумерация нужна, если сузился любой
+    edges = [low or 0, *keys] + ([high] if high is not None else [])
+    if min(right - left for left, right in zip(edges, edges[1:])) < SORT_MIN_GAP:
+        transaction.on_commit(lambda: rebalance_suite_task.delay(project_id, suite_id))
+    return cases
+
+
+class CaseReorderSerializer(serializers.Serializer):
+    cases = serializers.PrimaryKeyRelatedField(queryset=CasePage.active_on_site.all(), many=True, allow_empty=False)
+    after = serializers.PrimaryKeyRelatedField(queryset=CasePage.active_on_site.all(), required=False, allow_null=True)
+    before = serializers.PrimaryKeyRelatedField(queryset=CasePage.active_on_site.all(), required=False, allow_null=True)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # кейсы и соседи ищутся только среди доступных пользователю во вьюсете
+        view = self.context.get('view')
+        if view is not None:
+            queryset = view.get_queryset()
+            self.fields['cases'].child_relation.queryset = queryset
+            self.fields['after'].queryset = queryset
+            self.fields['before'].queryset = queryset
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        after, before = attrs.get('after'), attrs.get('before')
+        if (after is None) == (before is None):
+            raise serializers.ValidationError({'non_field_errors': [_('Укажите ровно один из параметров after или before')]})
+        anchor = after or before
+        if anchor in attrs['cases']:
+            raise serializers.ValidationError({'non_field_errors': [_('Кейс не может быть перемещён относительно себя')]})
+        if any(case.project_id != anchor.project_id for case in attrs['cases']):
+            raise serializers.ValidationError({'cases': [_('Кейсы должны принадлежать одному проекту')]})
+        return attrs
@@ -1,14 +1,17 @@
+from django.utils.functional import cached_property
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from content.serializers.attachment import AttachmentSerializer
 from eqator_projects.models import CaseRun, CaseRunStep, CommentStatus, CasePage
 from eqator_projects.serializers.tag import TagSerializer
 from helpers.enums import CaseStatusEnum, CaseSyncModeEnum
 from django.utils.translation import gettext_lazy as _
 
 from user.serializers import UserSerializer
+from .case_attachments import AttachmentsSummarySerializer
+from .fast_list_serializer import FastListSerializer
+from .tag_lookup import CachedTagsField
 from .milestone import MilestoneReportsShortSerializer
 
 
@@ -25,29 +28,38 @@ class StepsInfoSerializer(serializers.Serializer):
 class CaseRunsSerializer(serializers.ModelSerializer):
     # code = serializers.CharField(source='case.slug')
     case_id = serializers.IntegerField(source='case.id')
-    comments_count = serializers.IntegerField()
-    files = AttachmentSerializer(many=True, read_only=True, source='case.attachments')
-    issues_count = serializers.IntegerField()
+    comments_count = serializers.IntegerField(read_only=True)
+    files_summary = AttachmentsSummarySerializer(source='*', read_only=True)
+    issues_count = serializers.IntegerField(read_only=True)
     original_update_by = UserSerializer(read_only=True)
-    tags = TagSerializer(many=True)
+    tags = CachedTagsField()
 
     class Meta:
         model = CaseRun
+        list_serializer_class = FastListSerializer
         fields = (
             'id', 'title', 'case_id', 'code', 'priority', 'status', 'behavior', 'absolute_url', 'status_updated_at', 'case_type',
-            'comments_count', 'issues_count', 'needs_update', 'original_update_by', 'original_update_at', 'files',
-            'tags', 'preconditions', 'requirement', 'description')
+            'comments_count', 'issues_count', 'needs_update', 'original_update_by', 'original_update_at',
+            'files_summary', 'tags', 'preconditions', 'requirement', 'description')
 
 
 class CaseRunsReportsSerializer(CaseRunsSerializer):
     milestone = serializers.SerializerMethodField(read_only=True)
 
+    @cached_property
+    def _milestones(self):
+        # в списке один экземпляр сериализатора на все строки, майлстоунов на странице единицы
+        return {}
+
     @extend_schema_field(MilestoneReportsShortSerializer())
     def get_milestone(self, obj):
-        return MilestoneReportsShortSerializer(obj.run.milestone).data
+        if obj.run.milestone_id not in self._milestones:
+            self._milestones[obj.run.milestone_id] = MilestoneReportsShortSerializer(obj.run.milestone).data
+        return self._milestones[obj.run.milestone_id]
 
     class Meta:
         model = CaseRun
+        list_serializer_class = FastListSerializer
         fields = CaseRunsSerializer.Meta.fields + ('milestone',)
 
 
@@ -62,8 +74,8 @@ class BaseCaseRunsSerializer(serializers.ModelSerializer):
 
 
 class CaseRunPageSerializer(serializers.ModelSerializer):
-    comments_count = serializers.IntegerField()
-    issues_count = serializers.IntegerField()
+    comments_count = serializers.IntegerField(read_only=True)
+    issues_count = serializers.IntegerField(read_only=True)
     code = serializers.CharField(source='case.slug')
     to_general = serializers.CharField(source='case.absolute_url')
     tags = TagSerializer(many=True)
@@ -76,8 +88,8 @@ class CaseRunPageSerializer(serializers.ModelSerializer):
 
 
 class CaseStepsSerializer(serializers.ModelSerializer):
-    comments_count = serializers.IntegerField()
-    issues_count = serializers.IntegerField()
+    comments_count = serializers.IntegerField(read_only=True)
+    issues_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = CaseRunStep
@@ -112,6 +124,25 @@ class CommentStatusSerializer(serializers.ModelSerializer):
         }
 
 
+class CaseRunStatusBatchItemSerializer(serializers.Serializer):
+    case_run = serializers.IntegerField()
+    step = serializers.IntegerField(required=False, allow_null=True, default=None)
+    status = serializers.ChoiceField(choices=CommentStatus.CaseStatus.choices)
+    comment = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+
+        if attrs['comment'] and attrs['status'] == CommentStatus.CaseStatus.UNTESTED:
+            raise ValidationError({'non_field_errors': [_('Нельзя добавить комментарий в статусе "Непроверенный"')]})
+
+        return attrs
+
+
+class CaseRunStatusBatchSerializer(serializers.Serializer):
+    items = CaseRunStatusBatchItemSerializer(many=True, allow_empty=False)
+
+
 class CommentStatusChangeSerializer(serializers.ModelSerializer):
     class Meta:
         model = CaseRun
@@ -125,11 +156,23 @@ class CaseSyncSerializer(serializers.Serializer):
     mode = serializers.ChoiceField(choices=CaseSyncModeEnum.choices)
 
 
+class CaseBulkSyncSerializer(CaseSyncSerializer):
+    dry_run = serializers.BooleanField(default=False)
+
+
+class CaseSyncReportSerializer(serializers.Serializer):
+    case_runs = serializers.IntegerField(default=0)
+    steps_updated = serializers.IntegerField(default=0)
+    steps_created = serializers.IntegerField(default=0)
+    steps_deleted = serializers.IntegerField(default=0)
+
+
 class CaseRunsTestplanSerializer(serializers.ModelSerializer):
     code = serializers.CharField(source='case.slug')
 
     class Meta:
         model = CaseRun
+        list_serializer_class = FastListSerializer
         fields = (
             'id', 'title', 'code', 'priority', 'status',
             'behavior', 'absolute_url', 'case_type', 'needs_update'
@@ -0,0 +1,120 @@
+from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+
+from eqator_projects.models import CaseRun, CaseRunStep, Comment, Issue
+
+
+class CaseRunCountersMixin(models.Model):
+    """
+    Денормализованные счётчики комментариев и задач.
+    Подмешивается в CaseRun и CaseRunStep вместо аннотаций Count.
+    """
+    comments_count = models.PositiveIntegerField(verbose_name=_('Количество комментариев'), default=0, db_index=True)
+    issues_count = models.PositiveIntegerField(verbose_name=_('Количество задач'), default=0, db_index=True)
+
+    class Meta:
+        abstract = True
+
+
+# модель -> (поле счётчика, FK на прогон кейса, FK на шаг)
+COUNTED_MODELS = {
+    Comment: ('comments_count', 'case_run', 'case_run_step'),
+    Issue: ('issues_count', 'case_run', 'case_run_step'),
+}
+# мягко удалённые записи (DeleteMixin) в счётчиках не участвуют
+SOFT_DELETE_FIELD = 'is_deleted'
+
+
+def _alive_filters(model, prefix=''):
+    fields = {field.name for field in model._meta.get_fields()}
+    return {f'{prefix}{SOFT_DELETE_FIELD}': False} if SOFT_DELETE_FIELD in fields else {}
+
+
+def _counter_target(model, values):
+    """
+    Куда засчитывается запись: шаг, если указан, иначе прогон кейса; None - никуда.
+    """
+    _, case_run_field, step_field = COUNTED_MODELS[model]
+    if values.get(SOFT_DELETE_FIELD):
+        return None
+    if values.get(f'{step_field}_id'):
+        return CaseRunStep, values[f'{step_field}_id']
+    if values.get(f'{case_run_field}_id'):
+        return CaseRun, values[f'{case_run_field}_id']
+    return None
+
+
+def _instance_values(instance):
+    _, case_run_field, step_field = COUNTED_MODELS[type(instance)]
+    return {
+        f'{case_run_field}_id': getattr(instance, f'{case_run_field}_id'),
+        f'{step_field}_id': getattr(instance, f'{step_field}_id'),
+        SOFT_DELETE_FIELD: getattr(instance, SOFT_DELETE_FIELD, False),
+    }
+
+
+def _shift_counter(model, target, delta):
+    if target is None:
+        return
+    counter = COUNTED_MODELS[model][0]
+    target_model, target_id = target
+    # записи, созданные до появления счётчиков, не уводят его ниже нуля
+    value = F(counter) + delta if delta > 0 else Greatest(F(counter) + delta, 0)
+    target_model.objects.filter(pk=target_id).update(**{counter: value})
+
+
+@receiver(pre_save, sender=Comment)
+@receiver(pre_save, sender=Issue)
+def counted_object_pre_save(sender, instance, using, **kwargs):
+    instance._counter_target = None
+    if instance.pk is None:
+        return
+    _, case_run_field, step_field = COUNTED_MODELS[sender]
+    fields = [f'{case_run_field}_id', f'{step_field}_id', *_alive_filters(sender)]
+    previous = sender._base_manager.db_manager(using).filter(pk=instance.pk).values(*fields).first()
+    if previous is not None:
+        instance._counter_target = _counter_target(sender, previous)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Issue)
+def counted_object_saved(sender, instance, **kwargs):
+    # создание, перенос на другой прогон/шаг и мягкое удаление или восстановление
+    previous = getattr(instance, '_counter_target', None)
+    current = _counter_target(sender, _instance_values(instance))
+    if previous != current:
+        _shift_counter(sender, previous, -1)
+        _shift_counter(sender, current, 1)
+    instance._counter_target = current
+
+
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Issue)
+def counted_object_deleted(sender, instance, **kwargs):
+    _shift_counter(sender, _counter_target(sender, _instance_values(instance)), -1)
+
+
+def _count_subquery(model, field, **filters):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}, **filters, **_alive_filters(model)).order_by().values(field)
+        .annotate(count=Count('pk')).values('count')[:1]
+    ), Value(0))
+
+
+def reconcile_counters(case_runs=None):
+    """
+    Пересчитывает счётчики по фактическим комментариям и задачам.
+    """
+    case_runs = case_runs if case_runs is not None else CaseRun.objects.all()
+    case_runs.update(
+        comments_count=_count_subquery(Comment, 'case_run', case_run_step__isnull=True),
+        issues_count=_count_subquery(Issue, 'case_run', case_run_step__isnull=True),
+    )
+    CaseRunStep.objects.filter(case_run__in=case_runs).update(
+        comments_count=_count_subquery(Comment, 'case_run_step'),
+        issues_count=_count_subquery(Issue, 'case_run_step'),
+    )
@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from eqator_projects.models import CaseRun, CaseRunStep, CommentStatus, RunPage
+from eqator_projects.services.events import publish_case_run_status, publish_run_progress
+from eqator_projects.services.milestone_reports import invalidate_milestone_rollup
+from eqator_projects.services.project_cache import bump_project_version
+
+
+def get_run_progress(run):
+    """
+    Количество прогонов кейсов прогона по статусам.
+    """
+    progress = {value: 0 for value in CaseRun.CaseStatus.values}
+    for row in CaseRun.objects.filter(run=run).values('status').annotate(count=Count('id')).order_by():
+        progress[row['status']] = row['count']
+    progress['count'] = sum(progress.values())
+    return progress
+
+
+def update_run_progress(run):
+    run.progress = get_run_progress(run)
+    RunPage.objects.filter(pk=run.pk).update(progress=run.progress)
+    return run.progress
+
+
+def apply_status_batch(run, items, user):
+    """
+    Применяет пачку смен статусов прогонов кейсов и шагов одной транзакцией
+    и один раз пересчитывает прогресс прогона. Возвращает ошибки по индексам
+    элементов, если что-то не найдено, и прогресс прогона.
+    """
+    case_run_ids = {item['case_run'] for item in items}
+    step_ids = {item['step'] for item in items if item['step']}
+
+    with transaction.atomic():
+        case_runs = CaseRun.objects.select_for_update().filter(run=run, id__in=case_run_ids).in_bulk()
+        steps = CaseRunStep.objects.select_for_update() \
+            .filter(case_run__in=case_runs.keys(), id__in=step_ids).in_bulk()
+
+        errors = {}
+        for index, item in enumerate(items):
+            if item['case_run'] not in case_runs:
+                errors[index] = [_('Прогон кейса не найден')]
+            elif item['step'] and (item['step'] not in steps or steps[item['step']].case_run_id != item['case_run']):
+                errors[index] = [_('Шаг не найден')]
+        if errors:
+            return errors, None
+
+        now = timezone.now()
+        changed_case_runs, changed_steps, comments = {}, {}, []
+        for item in items:
+            if item['step']:
+                step = steps[item['step']]
+                step.status = item['status']
+                changed_steps[step.id] = step
+            else:
+                case_run = case_runs[item['case_run']]
+                case_run.status = item['status']
+                case_run.status_updated_at = now
+                changed_case_runs[case_run.id] = case_run
+            if item['comment']:
+                comments.append(CommentStatus(
+                    case_run_id=item['case_run'],
+                    case_run_step_id=item['step'],
+                    status=item['status'],
+                    comment=item['comment'],
+                    user=user,
+                ))
+
+        CaseRun.objects.bulk_update(changed_case_runs.values(), ['status', 'status_updated_at'])
+        CaseRunStep.objects.bulk_update(changed_steps.values(), ['status'])
+        CommentStatus.objects.bulk_create(comments)
+        progress = update_run_progress(run)
+        invalidate_milestone_rollup(run.milestone_id)
+        bump_project_version(run.project_id)
+
+    for case_run in changed_case_runs.values():
+        publish_case_run_status(case_run)
+    publish_run_progress(run, progress)
+    return None, progress
@@ -0,0 +1,138 @@
+from django.db import transaction
+from django.utils import timezone
+
+from app.celery import app as celery_app
+from eqator_projects.models import CaseRun, CaseRunStep, RunPage, MilestonePage, Step
+from eqator_projects.services.milestone_reports import invalidate_milestone_rollup
+from eqator_projects.services.project_cache import bump_project_version
+from helpers.enums import CaseSyncModeEnum
+
+SYNC_CHUNK_SIZE = 500
+
+CASE_RUN_SYNC_FIELDS = (
+    'title', 'code', 'priority', 'behavior', 'case_type', 'preconditions', 'requirement', 'description',
+)
+# поле прогона кейса -> поле кейса, если называются по-разному
+CASE_SOURCE_FIELDS = {'code': 'slug'}
+STEP_SYNC_FIELDS = ('description', 'expected_result')
+
+
+def get_outdated_case_runs(run=None, milestone=None):
+    """
+    Все устаревшие прогоны кейсов прогона или майлстоуна одним запросом.
+    """
+    qs = CaseRun.objects.filter(needs_update=True).select_related('case', 'run')
+    if run is not None:
+        qs = qs.filter(run=run)
+    if milestone is not None:
+        qs = qs.filter(run__milestone=milestone)
+    return qs.order_by('id')
+
+
+def _chunks(items, size=SYNC_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _diff_steps(case_run, run_steps, case_steps, mode):
+    """
+    Сравнивает шаги прогона кейса с шагами кейса по номеру.
+    """
+    to_update, to_create, to_delete = [], [], []
+    run_steps_by_number = {step.number: step for step in run_steps}
+
+    for case_step in case_steps:
+        run_step = run_steps_by_number.pop(case_step.number, None)
+        if run_step is None:
+            to_create.append(CaseRunStep(
+                case_run=case_run,
+                number=case_step.number,
+                description=case_step.description,
+                expected_result=case_step.expected_result,
+            ))
+            continue
+        changed = any(getattr(run_step, field) != getattr(case_step, field) for field in STEP_SYNC_FIELDS)
+        if changed:
+            for field in STEP_SYNC_FIELDS:
+                setattr(run_step, field, getattr(case_step, field))
+        if mode == CaseSyncModeEnum.RESET_STATUSES and run_step.status != CaseRunStep.CaseStatus.UNTESTED:
+            run_step.status = CaseRunStep.CaseStatus.UNTESTED
+            changed = True
+        if changed:
+            to_update.append(run_step)
+
+    to_delete.extend(step.id for step in run_steps_by_number.values())
+    return to_update, to_create, to_delete
+
+
+def sync_case_runs(case_runs, mode, dry_run=False):
+    """
+    Массовая синхронизация устаревших прогонов кейсов с их кейсами.
+    Прогоны кейсов блокируются до конца транзакции, шаги сравниваются в памяти,
+    изменения пишутся пачками.
+    """
+    with transaction.atomic():
+        if not dry_run and hasattr(case_runs, 'select_for_update'):
+            case_runs = case_runs.select_for_update(of=('self',))
+        case_runs = list(case_runs)
+        report = {'case_runs': len(case_runs), 'steps_updated': 0, 'steps_created': 0, 'steps_deleted': 0}
+        if not case_runs:
+            return report
+
+        case_ids = {case_run.case_id for case_run in case_runs}
+        case_steps = {}
+        for step in Step.objects.filter(case_id__in=case_ids).order_by('number'):
+            case_steps.setdefault(step.case_id, []).append(step)
+
+        run_steps = {}
+        for step in CaseRunStep.objects.filter(case_run__in=case_runs).order_by('number'):
+            run_steps.setdefault(step.case_run_id, []).append(step)
+
+        steps_to_update, steps_to_create, steps_to_delete = [], [], []
+        now = timezone.now()
+        for case_run in case_runs:
+            for field in CASE_RUN_SYNC_FIELDS:
+                setattr(case_run, field, getattr(case_run.case, CASE_SOURCE_FIELDS.get(field, field)))
+            case_run.needs_update = False
+            case_run.original_update_at = now
+            if mode == CaseSyncModeEnum.RESET_STATUSES:
+                case_run.status = CaseRun.CaseStatus.UNTESTED
+
+            to_update, to_create, to_delete = _diff_steps(
+                case_run, run_steps.get(case_run.id, []), case_steps.get(case_run.case_id, []), mode
+            )
+            steps_to_update.extend(to_update)
+            steps_to_create.extend(to_create)
+            steps_to_delete.extend(to_delete)
+
+        report.update({
+            'steps_updated': len(steps_to_update),
+            'steps_created': len(steps_to_create),
+            'steps_deleted': len(steps_to_delete),
+        })
+        if dry_run:
+            return report
+
+        case_run_fields = CASE_RUN_SYNC_FIELDS + ('needs_update', 'original_update_at', 'status')
+        for chunk in _chunks(case_runs):
+            CaseRun.objects.bulk_update(chunk, case_run_fields)
+        for chunk in _chunks(steps_to_update):
+            CaseRunStep.objects.bulk_update(chunk, STEP_SYNC_FIELDS + ('status',))
+        CaseRunStep.objects.bulk_create(steps_to_create, batch_size=SYNC_CHUNK_SIZE)
+        for chunk in _chunks(steps_to_delete):
+            CaseRunStep.objects.filter(id__in=chunk).delete()
+        for milestone_id in {case_run.run.milestone_id for case_run in case_runs}:
+            invalidate_milestone_rollup(milestone_id)
+        for project_id in {case_run.run.project_id for case_run in case_runs}:
+            bump_project_version(project_id)
+    return report
+
+
+@celery_app.task
+def sync_case_runs_task(mode, run_id=None, milestone_id=None):
+    run = RunPage.objects.filter(pk=run_id).first() if run_id else None
+    milestone = MilestonePage.objects.filter(pk=milestone_id).first() if milestone_id else None
+    # прогон или майлстоун удалили, пока задача ждала в очереди
+    if (run_id and run is None) or (milestone_id and milestone is None):
+        return None
+    return sync_case_runs(get_outdated_case_runs(run=run, milestone=milestone), mode)
@@ -0,0 +1,116 @@
+from contextvars import ContextVar
+
+from django.db import models, router
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+
+
+class CaseStepsCountMixin(models.Model):
+    """
+    Денормализованное количество шагов кейса вместо аннотации Count('steps').
+    """
+    steps_count = models.PositiveIntegerField(verbose_name=_('Количество шагов'), default=0, db_index=True)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        # steps_count ведут шаги; полное сохранение устаревшего экземпляра не должно его затирать
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding and (update_fields is None or 'steps_count' in update_fields):
+            using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+            steps_count = type(self)._base_manager.db_manager(using).filter(pk=self.pk) \
+                .values_list('steps_count', flat=True).first()
+            if steps_count is not None:
+                self.steps_count = steps_count
+        super().save(*args, **kwargs)
+
+
+def update_steps_count(case_ids):
+    from eqator_projects.models import CasePage, Step
+    from eqator_projects.services.approximate_counts import bump_model_counts
+    from eqator_projects.services.project_cache import bump_case_projects
+
+    case_ids = [case_id for case_id in set(case_ids) if case_id]
+    if not case_ids:
+        return
+    CasePage.objects.filter(id__in=case_ids).update(steps_count=Coalesce(Subquery(
+        Step.objects.filter(case=OuterRef('pk')).order_by().values('case')
+        .annotate(count=Count('pk')).values('count')[:1]
+    ), Value(0)))
+    bump_case_projects(case_ids)
+    bump_model_counts(CasePage)
+
+
+# на время StepQuerySet.delete() post_delete по строкам не сдвигает счётчик - кейсы пересчитываются один раз
+_bulk_delete_in_progress = ContextVar('steps_bulk_delete_in_progress', default=False)
+
+
+class StepQuerySet(models.QuerySet):
+    """
+    Массовые операции со шагами пересчитывают steps_count затронутых кейсов.
+    """
+
+    def _for_write_values(self, field):
+        # затронутые кейсы читаются с той же базы, куда пойдёт запись
+        return self.using(self._db or router.db_for_write(self.model)).values_list(field, flat=True)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        update_steps_count(obj.case_id for obj in objs)
+        return objs
+
+    def update(self, **kwargs):
+        case_ids = set(self._for_write_values('case_id')) if 'case' in kwargs or 'case_id' in kwargs else ()
+        rows = super().update(**kwargs)
+        if case_ids:
+            update_steps_count(case_ids | {getattr(kwargs.get('case'), 'pk', kwargs.get('case_id'))})
+        return rows
+
+    def delete(self):
+        case_ids = set(self._for_write_values('case_id'))
+        token = _bulk_delete_in_progress.set(True)
+        try:
+            result = super().delete()
+        finally:
+            _bulk_delete_in_progress.reset(token)
+        update_steps_count(case_ids)
+        return result
+
+
+def _shift_steps_count(case_id, delta):
+    from eqator_projects.models import CasePage
+    from eqator_projects.services.approximate_counts import bump_model_counts
+    from eqator_projects.services.project_cache import bump_case_projects
+
+    if case_id:
+        steps_count = F('steps_count') + delta if delta > 0 else Greatest(F('steps_count') + delta, 0)
+        CasePage.objects.filter(pk=case_id).update(steps_count=steps_count)
+        bump_case_projects([case_id])
+        bump_model_counts(CasePage)
+
+
+@receiver(pre_save, sender='eqator_projects.Step')
+def step_pre_save(sender, instance, using, **kwargs):
+    # кейс, к которому шаг относился до сохранения: перенос шага пересчитывает оба
+    instance._counted_case_id = None if instance._state.adding else \
+        sender._base_manager.db_manager(using).filter(pk=instance.pk).values_list('case_id', flat=True).first()
+
+
+@receiver(post_save, sender='eqator_projects.Step')
+def step_saved(sender, instance, created, **kwargs):
+    old_case_id = getattr(instance, '_counted_case_id', None)
+    if created:
+        _shift_steps_count(instance.case_id, 1)
+    elif old_case_id != instance.case_id:
+        _shift_steps_count(old_case_id, -1)
+        _shift_steps_count(instance.case_id, 1)
+
+
+@receiver(post_delete, sender='eqator_projects.Step')
+def step_deleted(sender, instance, **kwargs):
+    if not _bulk_delete_in_progress.get():
+        _shift_steps_count(instance.case_id, -1)
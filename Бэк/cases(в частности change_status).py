@@ -1,6 +1,7 @@
 import json
 import django_filters
-from django.db.models import Count, Value, F
+from asgiref.sync import sync_to_async
+from django.db.models import BooleanField, Case, Value, When
 from django.utils.translation import gettext_lazy as _
 from django_filters.rest_framework import FilterSet, DjangoFilterBackend
 from drf_spectacular.utils import extend_schema, OpenApiParameter
@@ -13,7 +14,7 @@ from rest_framework.response import Response
 from ai_assistants.services.action_async import async_action, async_serializer_validate_data
 from eqator_projects.models import (
     CasePage, Suite, ProjectPage,
-    CasePlan, TestPlan, UserProject, Step
+    CasePlan, TestPlan, UserProject
 )
 from helpers import QSearchFilter
 from helpers.enums import BehaviorEnum
@@ -25,13 +26,20 @@ from ..serializers.case import CaseListSerializer, CaseSerializer, CaseDataSeria
     CasesOpenAIPreconditionSerializer, TestPlanAddSerializer, ListDeleteSerializer, CaseUrlSerializer, \
     CasesOpenAIArrayResultSerializer, CasesOpenAIArraySerializer
 from eqator_projects.serializers.test_plan import TestPlanSerializer
+from ..services import case_ordering
 from ..services.abac_permissions_service import abac_service
+from ..services.approximate_counts import ApproximateCountPagination
+from ..services.async_reads import AsyncReadViewSetMixin, afetch
+from ..services.case_ordering import CaseReorderSerializer
+from ..services.compact_format import CompactFormatMixin
+from ..services.conditional import ConditionalResponseMixin
+from ..db_router import ReplicaReadMixin
 from ..services.notifications import NotifyService
-from ..filtersets import SuiteModelMultipleChoiceFilter
+from ..services.project_cache import ProjectCacheWarmMixin, project_caches
+from ..filtersets import SuiteModelMultipleChoiceFilter, TagsExistsFilter
 from ai_assistants.services.ai_assistant_service import AIAssistantService
 from ai_assistants.services.ai_assistant_service import get_response_ai_assistant
 from ai_assistants.exceptions import AIAssistantRequestError
-from content.models.tags import Tags
 
 Company = get_company_model()
 
@@ -39,13 +47,14 @@ Company = get_company_model()
 class CasesFilter(FilterSet):
     suite = django_filters.ModelMultipleChoiceFilter(queryset=Suite.objects.all())
     suite_tree = SuiteModelMultipleChoiceFilter(queryset=Suite.objects.all(), field_name='suite')
-    tags = django_filters.ModelMultipleChoiceFilter(queryset=Tags.objects.all())
+    tags = TagsExistsFilter()
     priority = django_filters.MultipleChoiceFilter(choices=CasePage.Priority.choices)
     status = django_filters.MultipleChoiceFilter(choices=CasePage.STATUS.choices)
     case_type = django_filters.MultipleChoiceFilter(choices=CasePage.Type.choices)
     behavior = django_filters.MultipleChoiceFilter(choices=BehaviorEnum.choices)
     project = django_filters.ModelChoiceFilter(field_name='project', queryset=ProjectPage.active_on_site.all())
     without_suite = django_filters.BooleanFilter(method='without_suite_filter')
+    has_steps = django_filters.BooleanFilter(method='has_steps_filter')
     company = django_filters.ModelChoiceFilter(field_name='project__company', queryset=Company.active_on_site.all())
 
     def without_suite_filter(self, qs, name, value):
@@ -53,15 +62,25 @@ class CasesFilter(FilterSet):
             return qs.filter(suite__isnull=True)
         return qs
 
+    def has_steps_filter(self, qs, name, value):
+        if value is None:
+            return qs
+        return qs.filter(steps_count__gt=0) if value else qs.filter(steps_count=0)
 
-class CasesView(viewsets.ModelViewSet):
-    queryset = CasePage.active_on_site.all().order_by('sort', '-created_at')
+
+class CasesView(AsyncReadViewSetMixin, CompactFormatMixin, ProjectCacheWarmMixin, ReplicaReadMixin,
+                ConditionalResponseMixin, viewsets.ModelViewSet):
+    queryset = CasePage.active_on_site.all().order_by('sort', 'id')
     permission_classes = [permissions.IsAuthenticated & SourcePermission]
     filter_backends = [DjangoFilterBackend, QSearchFilter, OrderingFilter]
     filterset_class = CasesFilter
     search_fields = ['title']
-    ordering_fields = ['sort']
+    ordering_fields = ['sort', 'steps_count']
     http_method_names = ['get', 'post', 'patch', 'head', 'options', 'delete']
+    replica_actions = ('list', 'member_list')
+    pagination_class = ApproximateCountPagination
+    compact_actions = ('list', 'member_list')
+    compact_side_tables = {'original_update_by': 'users', 'created_by': 'users', 'updated_by': 'users'}
 
     def get_permission_source(self):
         if self.action in ['list', 'member_list']:
@@ -89,6 +108,8 @@ class CasesView(viewsets.ModelViewSet):
             return TestPlanSerializer
         if self.action == 'delete_list':
             return ListDeleteSerializer
+        if self.action == 'reorder':
+            return CaseReorderSerializer
         if self.action == 'change_status':
             return CaseStatusSerializer
         if self.action == 'clone':
@@ -102,7 +123,7 @@ class CasesView(viewsets.ModelViewSet):
             self.list.__name__,
             self.member_list.__name__,
         }:
-            qs = qs.prefetch_related('tags').select_related('suite').annotate(steps_count=Count('steps'))
+            qs = qs.prefetch_related('tags').select_related('suite')
 
         return abac_service.filter_queryset(qs, 'cases', ['project'], self.request.user)
 
@@ -193,8 +214,8 @@ class CasesView(viewsets.ModelViewSet):
             new_status = target_status
         else:
             return Response({'result': []}, status=status.HTTP_403_FORBIDDEN)
-        if instance.case_type != CasePage.Type.TASK and not Step.objects.filter(
-                case=instance).count() and new_status in [CasePage.STATUS.REFINEMENT, CasePage.STATUS.APPROVED]:
+        if instance.case_type != CasePage.Type.TASK and not instance.steps_count and new_status in [
+                CasePage.STATUS.REFINEMENT, CasePage.STATUS.APPROVED]:
             return Response({'non_field_errors': [_('Отсутствуют шаги')]}, status=status.HTTP_400_BAD_REQUEST)
 
         instance.set_status(new_status)
@@ -202,16 +223,9 @@ class CasesView(viewsets.ModelViewSet):
         return Response({'status': 'success'})
 
     @action(methods=['GET'], detail=False)
-    def member_list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+    async def member_list(self, request, *args, **kwargs):
+        queryset = await sync_to_async(lambda: self.filter_queryset(self.get_queryset()))()
+        return await self.aconditional_response(request, queryset, lambda: self.alist_response(queryset))
 
     @extend_schema(responses=CasesOpenAIResultSerializer, request=CasesOpenAISerializer)
     @async_action(methods=['POST'], detail=False, filterset_class=None, search_fields=None)
@@ -282,61 +296,61 @@ class CasesView(viewsets.ModelViewSet):
 
         return Response(data)
 
-    @action(methods=['GET'], detail=True)
-    def get_next(self, request, pk, *args, **kwargs):
-        instance = self.get_object()
-        cases = self.get_queryset().filter(
-            project=instance.project, id__gt=instance.id, suite=instance.suite
-        ).order_by('sort')
-        if cases.count() == 0:
-            next_suite = Suite.get_next(instance.suite, instance.project)
-            if next_suite:
-                cases = self.get_queryset().filter(project=instance.project, suite=next_suite).order_by('sort')
-        if cases.count() > 0:
-            next_case = cases.first()
-            data = {"id": next_case.id,
-                    "url": next_case.absolute_url,
-                    "title": next_case.title}
-        else:
-            data = {"id": None,
+    def _case_link(self, case):
+        if case is None:
+            return {"id": None,
                     "url": None,
                     "title": None}
-        return Response(data)
+        return {"id": case.id,
+                "url": case.absolute_url,
+                "title": case.title}
 
     @action(methods=['GET'], detail=True)
-    def get_prev(self, request, pk, *args, **kwargs):
-        instance = self.get_object()
-        cases = self.get_queryset().filter(
-            project=instance.project, id__lt=instance.id, suite=instance.suite
-        ).order_by('sort', 'id')
+    async def get_next(self, request, pk, *args, **kwargs):
+        instance = await self.aget_object()
+        queryset = await sync_to_async(self.get_queryset)()
+        next_case = await case_ordering.anext_case(
+            queryset.filter(project_id=instance.project_id, suite_id=instance.suite_id), instance
+        )
+        if next_case is None:
+            next_suite = await sync_to_async(lambda: Suite.get_next(instance.suite, instance.project))()
+            if next_suite:
+                next_case = await queryset.filter(
+                    project_id=instance.project_id, suite=next_suite).order_by('sort', 'id').afirst()
+        return Response(await sync_to_async(self._case_link)(next_case))
 
-        if cases.count() == 0:
-            prev_suite = Suite.get_prev(instance.suite, instance.project)
+    @action(methods=['GET'], detail=True)
+    async def get_prev(self, request, pk, *args, **kwargs):
+        instance = await self.aget_object()
+        queryset = await sync_to_async(self.get_queryset)()
+        prev_case = await case_ordering.aprev_case(
+            queryset.filter(project_id=instance.project_id, suite_id=instance.suite_id), instance
+        )
+        if prev_case is None:
+            prev_suite = await sync_to_async(lambda: Suite.get_prev(instance.suite, instance.project))()
             if prev_suite:
-                cases = self.get_queryset().filter(project=instance.project, suite=prev_suite).order_by('sort', 'id')
+                prev_case = await queryset.filter(
+                    project_id=instance.project_id, suite=prev_suite).order_by('sort', 'id').alast()
+        return Response(await sync_to_async(self._case_link)(prev_case))
 
-        if cases.count() > 0:
-            prev_case = cases.last()
-            data = {"id": prev_case.id,
-                    "url": prev_case.absolute_url,
-                    "title": prev_case.title}
-        else:
-            data = {"id": None,
-                    "url": None,
-                    "title": None}
-        return Response(data)
+    @extend_schema(request=CaseReorderSerializer)
+    @action(methods=['POST'], detail=False, filterset_class=None, search_fields=None)
+    def reorder(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cases = case_ordering.move_cases(
+            serializer.validated_data['cases'],
+            after=serializer.validated_data.get('after'),
+            before=serializer.validated_data.get('before'),
+        )
+        return Response([{'id': case.id, 'sort': case.sort} for case in cases])
 
     @action(methods=['GET'], detail=True)
-    def testplans(self, request, *args, **kwargs):
-        instance = self.get_object()
+    async def testplans(self, request, *args, **kwargs):
+        instance = await self.aget_object()
         queryset = TestPlan.objects.filter(
             cases__id__exact=instance.pk)
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return await self.alist_response(queryset)
 
     @action(methods=['POST'], detail=True)
     def testplans_add(self, request, *args, **kwargs):
@@ -355,30 +369,48 @@ class CasesView(viewsets.ModelViewSet):
         return Response(_data)
 
     @extend_schema(parameters=[
-        OpenApiParameter(name='full_list', type=bool)
+        OpenApiParameter(name='full_list', type=bool),
+        OpenApiParameter(name='tags_mode', type=str, enum=['or', 'and'], required=False)
     ])
-    def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset()).annotate(show_link=Value(
-            abac_service.check_project_permissions(
-                UserProject.active_objects.filter(project=F('project'), user=request.user).first(), 'case',
-                request.method)
-        )
-        )
+    async def list(self, request, *args, **kwargs):
+        queryset = await sync_to_async(self._list_queryset)(request)
+        return await self.aconditional_response(request, queryset, lambda: self._list_response(request, queryset))
+
+    def _list_queryset(self, request):
+        return self.filter_queryset(self.get_queryset()).annotate(show_link=self._show_link(request))
+
+    def _show_link(self, request):
+        """
+        Право пользователя на кейс в проекте кейса, роли берутся из кеша проекта.
+        """
+        project_id = request.query_params.get('project')
+        if str(project_id or '').isdigit():
+            project_ids = [int(project_id)]
+        else:
+            project_ids = UserProject.active_objects.filter(user=request.user).values_list('project_id', flat=True)
+        whens = []
+        for project_id in project_ids:
+            user_project = project_caches.get('abac_roles', project_id).get(request.user.pk)
+            if user_project is not None:
+                allowed = abac_service.check_project_permissions(user_project, 'case', request.method)
+                whens.append(When(project_id=project_id, then=Value(bool(allowed))))
+        return Case(*whens, default=Value(False), output_field=BooleanField())
+
+    async def _list_response(self, request, queryset):
         if request.GET.get('full_list', None) is not None:
-            serializer = self.get_serializer(queryset, many=True)
+            cases = await afetch(queryset)
             return Response({
-                'count': queryset.count(),
+                'count': len(cases),
+                'count_exact': True,
                 'next': None,
                 'previous': None,
-                'results': serializer.data
+                'results': await self.aserializer_data(cases, many=True)
             })
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+        return await self.alist_response(queryset)
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+    async def retrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        return Response(await self.aserializer_data(instance))
 
     @action(methods=['POST'], detail=False)
     def delete_list(self, request, *args, **kwargs):
@@ -0,0 +1,45 @@
+from django.core.cache import cache
+
+from eqator_projects.services.project_cache import project_caches
+from eqator_projects.services.request_metrics import metrics_registry
+from eqator_projects.tests.helpers.create_project_mixin import CreateProjectMixin
+
+
+class ClassDataProjectMixin(CreateProjectMixin):
+    """
+    Хелперы CreateProjectMixin на уровне класса - для setUpTestData.
+    Хелпер выполняется на настоящем экземпляре теста, выставленные им
+    атрибуты переносятся на класс. Каждый тест получает свой locmem-кеш:
+    общий кеш не чистится, поэтому параллельные воркеры (--parallel) с общим
+    бэкендом кеша не сбрасывают данные друг другу.
+    """
+
+    @classmethod
+    def _run_helper(cls, name, *args):
+        helper = cls()
+        before = set(vars(helper))
+        result = getattr(helper, name)(*args)
+        for attr in set(vars(helper)) - before:
+            setattr(cls, attr, getattr(helper, attr))
+        return result
+
+    @classmethod
+    def _set_common_class_data(cls):
+        cls._run_helper('_set_common_data')
+
+    @classmethod
+    def _create_class_project(cls, data):
+        return cls._run_helper('_create_project', data)
+
+    def setUp(self) -> None:
+        super().setUp()
+        cache_override = self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': self.id(),
+        }})
+        cache_override.enable()
+        self.addCleanup(cache_override.disable)
+        # locmem хранит данные по LOCATION до конца процесса
+        self.addCleanup(cache.clear)
+        project_caches.reset_stats()
+        metrics_registry.reset()
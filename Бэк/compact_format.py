@@ -0,0 +1,141 @@
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ответы меньше этого размера не сжимаются
+COMPRESS_MIN_SIZE = getattr(settings, 'COMPRESS_MIN_SIZE', 1024)
+
+
+def _is_object(value):
+    return isinstance(value, dict) and 'id' in value
+
+
+def to_columnar(rows, side_tables=None):
+    """
+    Список объектов -> столбцы и строки значений. Вложенные объекты с id
+    (пользователи, теги) выносятся в справочники refs и заменяются на id;
+    side_tables задаёт имя справочника по полю, иначе справочник называется как поле.
+    """
+    side_tables = side_tables or {}
+    columns = list(rows[0].keys()) if rows else []
+    refs = {}
+    values = []
+    for row in rows:
+        row_values = []
+        for column in columns:
+            value = row.get(column)
+            if _is_object(value):
+                refs.setdefault(side_tables.get(column, column), {})[value['id']] = value
+                value = value['id']
+            elif isinstance(value, list) and value and all(_is_object(item) for item in value):
+                table = refs.setdefault(side_tables.get(column, column), {})
+                for item in value:
+                    table[item['id']] = item
+                value = [item['id'] for item in value]
+            row_values.append(value)
+        values.append(row_values)
+    return {'columns': columns, 'rows': values, 'refs': refs}
+
+
+def to_compact(data, side_tables=None):
+    """
+    Компактное представление ответа списка; у постраничного ответа сворачиваются results.
+    """
+    if isinstance(data, list):
+        return to_columnar(data, side_tables)
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        return {**data, 'results': to_columnar(data['results'], side_tables)}
+    return data
+
+
+def _side_tables(renderer_context):
+    view = (renderer_context or {}).get('view')
+    return getattr(view, 'compact_side_tables', None)
+
+
+class CompactJSONRenderer(JSONRenderer):
+    """
+    Столбцовый JSON: ?format=compact или Accept: application/vnd.eqator.compact+json.
+    """
+    media_type = 'application/vnd.eqator.compact+json'
+    format = 'compact'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(to_compact(data, _side_tables(renderer_context)), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Столбцовое представление в MessagePack: ?format=msgpack или Accept: application/msgpack.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        encoder = encoders.JSONEncoder()
+        return msgpack.packb(to_compact(data, _side_tables(renderer_context)), default=encoder.default)
+
+
+def compress_response(request, response):
+    """
+    Сжимает отрендеренный ответ brotli (если установлен) или gzip по Accept-Encoding.
+    """
+    if response.streaming or response.has_header('Content-Encoding') or len(response.content) < COMPRESS_MIN_SIZE:
+        return
+    patch_vary_headers(response, ('Accept-Encoding',))
+    accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if brotli is not None and 'br' in accept_encoding:
+        content, encoding = brotli.compress(response.content, quality=5), 'br'
+    elif 'gzip' in accept_encoding:
+        content, encoding = gzip.compress(response.content, compresslevel=6), 'gzip'
+    else:
+        return
+
+    response.content = content
+    response['Content-Length'] = str(len(content))
+    response['Content-Encoding'] = encoding
+    # сжатое тело уже не совпадает побайтно с исходным
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = f'W/{etag}'
+
+
+class CompactFormatMixin:
+    """
+    Опт-ин для вьюсета: действия из compact_actions дополнительно отдаются
+    в компактных форматах и сжимаются. compact_side_tables объединяет поля
+    в общие справочники, например {'original_update_by': 'users'}.
+    """
+    compact_actions = ()
+    compact_side_tables = {}
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if getattr(self, 'action', None) in self.compact_actions:
+            renderers.append(CompactJSONRenderer())
+            if msgpack is not None:
+                renderers.append(MessagePackRenderer())
+        return renderers
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'action', None) in self.compact_actions and hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(lambda rendered: compress_response(request, rendered))
+        return response
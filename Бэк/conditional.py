@@ -0,0 +1,99 @@
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from eqator_projects.models import UserProject
+from eqator_projects.services.project_cache import get_project_versions
+
+
+def get_version_stamp(queryset, fields=('updated_at',), state_field=None, project_field=None):
+    """
+    Дешёвый штамп версии выборки: количество строк и максимум по полям дат.
+    state_field добавляет количество строк по каждому состоянию, для моделей,
+    где смена состояния не обновляет дату. project_field добавляет версии
+    проектов выборки: их увеличивают изменения без updated_at (теги, steps_count,
+    сьюты, роли, удаления).
+
+    Last-Modified возвращается только вместе с версиями проектов - удаление
+    строки не двигает максимум дат, а время изменения проекта двигает.
+    """
+    aggregates = {f'max_{field}': Max(field) for field in fields}
+    stamp = queryset.order_by().aggregate(count=Count('pk'), **aggregates)
+    last_modified = max((value for key, value in stamp.items() if key != 'count' and value), default=None)
+    if state_field:
+        stamp['states'] = sorted(
+            queryset.order_by().values(state_field).annotate(count=Count('pk')).values_list(state_field, 'count')
+        )
+    if not project_field:
+        return stamp, None
+
+    project_ids = sorted(set(queryset.order_by().values_list(project_field, flat=True).distinct()) - {None})
+    versions = get_project_versions(project_ids)
+    stamp['projects'] = [[project_id, versions[project_id][0]] for project_id in project_ids]
+    changed_at = [changed_at for _, changed_at in versions.values()]
+    if None in changed_at:
+        # время изменения проекта потеряно вместе с кешем
+        return stamp, None
+    return stamp, max(changed_at + [last_modified] if last_modified else changed_at, default=None)
+
+
+def get_user_stamp(user):
+    """
+    Пользователь и его роли в проектах: от них зависят права и show_link в ответе.
+    """
+    if not user.is_authenticated:
+        return None
+    return [user.pk, sorted(UserProject.active_objects.filter(user=user).values_list('project_id', 'abac_role_id'))]
+
+
+class ConditionalResponseMixin:
+    """
+    ETag / Last-Modified для GET эндпоинтов. Если данные не изменились,
+    отдаётся 304 без сериализации. Один URL отдаётся в разных форматах
+    по Accept, поэтому формат входит в ETag, а ответ варьируется по Accept.
+    """
+    version_fields = ('updated_at',)
+    version_project_field = 'project_id'
+
+    def _version_stamp(self, request, queryset, fields=None, state_field=None):
+        stamp, last_modified = get_version_stamp(
+            queryset, fields or self.version_fields, state_field, self.version_project_field
+        )
+        stamp['user'] = get_user_stamp(request.user)
+        return stamp, last_modified
+
+    def conditional_response(self, request, queryset, build_response, fields=None, state_field=None):
+        stamp, last_modified = self._version_stamp(request, queryset, fields, state_field)
+        etag, last_modified, response = self._check_conditions(request, stamp, last_modified)
+        if response is None:
+            response = build_response()
+        return self._set_conditional_headers(response, etag, last_modified)
+
+    async def aconditional_response(self, request, queryset, build_response, fields=None, state_field=None):
+        """
+        То же для асинхронных вьюх, build_response - корутинная функция.
+        """
+        stamp, last_modified = await sync_to_async(self._version_stamp)(request, queryset, fields, state_field)
+        etag, last_modified, response = self._check_conditions(request, stamp, last_modified)
+        if response is None:
+            response = await build_response()
+        return self._set_conditional_headers(response, etag, last_modified)
+
+    def _check_conditions(self, request, stamp, last_modified):
+        media_type = getattr(request, 'accepted_media_type', None)
+        raw = json.dumps([request.get_full_path(), media_type, stamp], default=str, sort_keys=True)
+        etag = quote_etag(hashlib.md5(raw.encode()).hexdigest())
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+        return etag, last_modified, get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    def _set_conditional_headers(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Accept',))
+        return response
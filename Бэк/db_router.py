@@ -0,0 +1,162 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, OperationalError, connections
+
+REPLICA_ALIAS = getattr(settings, 'REPLICA_DATABASE_ALIAS', 'replica')
+# сколько секунд после записи пользователь читает только с основной базы
+REPLICA_STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+REPLICA_MAX_LAG = getattr(settings, 'REPLICA_MAX_LAG', 5)
+REPLICA_LAG_CHECK_INTERVAL = 5
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_use_replica = ContextVar('use_replica', default=False)
+_lag_state = {'checked_at': 0.0, 'lag': 0.0}
+
+
+def _sticky_key(user_id):
+    return f'db_sticky:{user_id}'
+
+
+def mark_user_write(user):
+    if user is not None and user.is_authenticated:
+        cache.set(_sticky_key(user.pk), True, REPLICA_STICKY_SECONDS)
+
+
+def is_user_sticky(user):
+    return user is not None and user.is_authenticated and bool(cache.get(_sticky_key(user.pk)))
+
+
+def get_replica_lag():
+    """
+    Отставание реплики в секундах, проверяется не чаще раза в REPLICA_LAG_CHECK_INTERVAL.
+    Если всё полученное WAL уже применено, реплика не отстаёт: время последней
+    применённой транзакции на простаивающей основной базе ничего не говорит.
+    """
+    now = time.monotonic()
+    if now - _lag_state['checked_at'] < REPLICA_LAG_CHECK_INTERVAL:
+        return _lag_state['lag']
+
+    lag = 0.0
+    connection = connections[REPLICA_ALIAS]
+    if connection.vendor == 'postgresql':
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+                    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+                )
+                lag = float(cursor.fetchone()[0])
+        except DatabaseError:
+            lag = float('inf')
+    _lag_state.update(checked_at=now, lag=lag)
+    return lag
+
+
+def mark_replica_unavailable():
+    """
+    Реплика не ответила: до следующей проверки отставания читаем с основной базы.
+    """
+    _lag_state.update(checked_at=time.monotonic(), lag=float('inf'))
+
+
+def replica_available():
+    return REPLICA_ALIAS in settings.DATABASES and get_replica_lag() <= REPLICA_MAX_LAG
+
+
+@contextmanager
+def use_replica(enabled=True):
+    token = _use_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Чтение идёт на реплику только внутри use_replica(), остальное - на основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            return REPLICA_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaReadMixin:
+    """
+    Опт-ин для вьюсета: безопасные запросы из replica_actions читают с реплики,
+    если пользователь недавно ничего не писал и реплика не отстаёт.
+    Изменяющие запросы вьюсета включают липкость к основной базе (для токенной
+    авторизации, которую не видит ReplicaStickinessMiddleware). Если реплика
+    недоступна, действие повторяется на основной базе.
+    """
+    replica_actions = ()
+
+    def should_use_replica(self, request):
+        return (
+            request.method in SAFE_METHODS
+            and getattr(self, 'action', None) in self.replica_actions
+            and not is_user_sticky(request.user)
+            and replica_available()
+        )
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # предыдущее значение, а не токен: в асинхронных вьюхах initial и
+        # finalize_response выполняются в разных копиях контекста
+        self._replica_previous = _use_replica.get()
+        _use_replica.set(self.should_use_replica(request))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, OperationalError) and _use_replica.get():
+            mark_replica_unavailable()
+            _use_replica.set(False)
+            request = self.request
+            handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            if iscoroutinefunction(handler):
+                handler = async_to_sync(handler)
+            try:
+                return handler(request, *self.args, **self.kwargs)
+            except Exception as retry_exc:
+                exc = retry_exc
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        previous = getattr(self, '_replica_previous', None)
+        if previous is not None:
+            _use_replica.set(previous)
+            self._replica_previous = None
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            mark_user_write(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaStickinessMiddleware:
+    """
+    После успешного изменяющего запроса пользователь на время читает с основной базы.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            mark_user_write(getattr(request, 'user', None))
+        return response
@@ -0,0 +1,324 @@
+import gzip
+import hashlib
+import json
+import re
+import zlib
+
+import defusedxml.ElementTree as ET
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from eqator_projects.models import ProjectPage
+from eqator_projects.models.eqator_report import EqatorFileMetric, EqatorFileState, EqatorReport, EqatorTool
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# поле проекта с токеном интеграции из getEqatorIntegrationUrl/refreshEqatorIntegrationUrl
+EQATOR_TOKEN_FIELD = getattr(settings, 'EQATOR_INTEGRATION_TOKEN_FIELD', 'eqator_token')
+TOKEN_CACHE_TIMEOUT = 60 * 60
+INVALID_TOKEN_CACHE_TIMEOUT = 60
+INGEST_BATCH_SIZE = 1000
+# предел размера отчёта после распаковки
+INGEST_MAX_SIZE = getattr(settings, 'EQATOR_INGEST_MAX_SIZE', 200 * 1024 * 1024)
+# без ijson JSON-отчёт загружается в память целиком - принимаются только небольшие
+INGEST_MAX_SIZE_WITHOUT_IJSON = getattr(settings, 'DATA_UPLOAD_MAX_MEMORY_SIZE', None) or 2621440
+
+FLAKE8_LINE = re.compile(r'^(?P<path>.+?):\d+:\d+: (?P<code>[A-Z]+\d+)')
+RADON_RANKS = 'ABCDEF'
+# метрики, которые не суммируются в итогах отчёта
+NOT_SUMMED_METRICS = ('max_complexity', 'percent_covered')
+
+# EOFError - обрезанный gzip, zlib.error - повреждённый поток, AttributeError/TypeError/KeyError - JSON не той формы
+PARSE_ERRORS = (ValueError, KeyError, TypeError, AttributeError, OSError, EOFError, zlib.error, ET.ParseError) \
+    + ((ijson.JSONError,) if ijson else ())
+
+
+class ReportTooLarge(Exception):
+    pass
+
+
+class LimitedStream:
+    """
+    Поток отчёта с ограничением прочитанного объёма: сжатый отчёт проверяется
+    по размеру после распаковки, по мере чтения.
+    """
+
+    def __init__(self, stream, limit):
+        self._stream = stream
+        self._limit = limit
+        self._read = 0
+
+    def _count(self, data):
+        self._read += len(data)
+        if self._read > self._limit:
+            raise ReportTooLarge
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            # не больше лимита за раз, чтобы не распаковать всё до проверки
+            size = self._limit - self._read + 1
+        return self._count(self._stream.read(size))
+
+    def readline(self, size=-1):
+        if size is None or size < 0:
+            size = self._limit - self._read + 1
+        return self._count(self._stream.readline(size))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+def max_report_size(tool):
+    if ijson is None and tool in (EqatorTool.RADON, EqatorTool.BANDIT, EqatorTool.COVERAGE):
+        return min(INGEST_MAX_SIZE, INGEST_MAX_SIZE_WITHOUT_IJSON)
+    return INGEST_MAX_SIZE
+
+
+def _token_key(token):
+    return f'eqator_token:{hashlib.sha256(token.encode()).hexdigest()}'
+
+
+def _project_token_key(project_id):
+    return f'eqator_project_token:{project_id}'
+
+
+def get_project_id_by_token(token):
+    """
+    id проекта по токену интеграции из кеша; неверные токены тоже кешируются ненадолго.
+    """
+    key = _token_key(token)
+    project_id = cache.get(key)
+    if project_id is None:
+        project_id = ProjectPage.objects.filter(**{EQATOR_TOKEN_FIELD: token}).values_list('id', flat=True).first()
+        if project_id:
+            cache.set_many({key: project_id, _project_token_key(project_id): key}, TOKEN_CACHE_TIMEOUT)
+        else:
+            cache.set(key, 0, INVALID_TOKEN_CACHE_TIMEOUT)
+    return project_id or None
+
+
+@receiver(post_save, sender=ProjectPage)
+def project_token_changed(sender, instance, **kwargs):
+    # после обновления токена старый перестаёт работать сразу, а новый,
+    # если его уже пробовали и закешировали как неверный, начинает работать
+    keys = [_project_token_key(instance.pk)]
+    old_key = cache.get(keys[0])
+    if old_key:
+        keys.append(old_key)
+    token = getattr(instance, EQATOR_TOKEN_FIELD, None)
+    if token:
+        keys.append(_token_key(token))
+    cache.delete_many(keys)
+
+
+def _json_items(stream, prefix):
+    """
+    Пары ключ-значение объекта по prefix; с ijson отчёт разбирается потоком.
+    """
+    if ijson is not None:
+        yield from ijson.kvitems(stream, prefix, use_float=True)
+        return
+    data = json.load(stream)
+    for part in filter(None, prefix.split('.')):
+        data = data[part]
+    yield from data.items()
+
+
+def _json_array(stream, prefix):
+    if ijson is not None:
+        yield from ijson.items(stream, f'{prefix}.item', use_float=True)
+        return
+    yield from json.load(stream)[prefix]
+
+
+def parse_flake8(stream):
+    files = {}
+    for line in stream:
+        match = FLAKE8_LINE.match(line.decode('utf-8', errors='replace'))
+        if not match:
+            continue
+        metrics = files.setdefault(match['path'], {'issues': 0, 'codes': {}})
+        metrics['issues'] += 1
+        metrics['codes'][match['code']] = metrics['codes'].get(match['code'], 0) + 1
+    return files
+
+
+def parse_radon(stream):
+    files = {}
+    for path, blocks in _json_items(stream, ''):
+        if not isinstance(blocks, list):
+            continue
+        complexities = [block.get('complexity', 0) for block in blocks]
+        ranks = [block.get('rank', 'A') for block in blocks]
+        files[path] = {
+            'blocks': len(blocks),
+            'complexity': sum(complexities),
+            'max_complexity': max(complexities, default=0),
+            'rank': max(ranks, key=RADON_RANKS.find, default='A'),
+        }
+    return files
+
+
+def parse_bandit(stream):
+    files = {}
+    for issue in _json_array(stream, 'results'):
+        metrics = files.setdefault(issue['filename'], {'issues': 0, 'high': 0, 'medium': 0, 'low': 0})
+        metrics['issues'] += 1
+        severity = str(issue.get('issue_severity', '')).lower()
+        if severity in metrics:
+            metrics[severity] += 1
+    return files
+
+
+def parse_coverage(stream):
+    files = {}
+    for path, data in _json_items(stream, 'files'):
+        summary = data.get('summary', {})
+        files[path] = {
+            'statements': summary.get('num_statements', 0),
+            'covered': summary.get('covered_lines', 0),
+            'missing': summary.get('missing_lines', 0),
+            'percent_covered': round(summary.get('percent_covered', 0), 2),
+        }
+    return files
+
+
+def parse_unittest(stream):
+    """
+    JUnit XML, тесты группируются по файлу или модулю класса.
+    """
+    files = {}
+    for _, element in ET.iterparse(stream, events=('end',)):
+        if element.tag != 'testcase':
+            continue
+        path = element.get('file') or element.get('classname', '').rpartition('.')[0] or element.get('classname', '')
+        metrics = files.setdefault(path, {'tests': 0, 'failures': 0, 'errors': 0, 'skipped': 0, 'time': 0.0})
+        metrics['tests'] += 1
+        for outcome, key in (('failure', 'failures'), ('error', 'errors'), ('skipped', 'skipped')):
+            if element.find(outcome) is not None:
+                metrics[key] += 1
+        metrics['time'] = round(metrics['time'] + float(element.get('time') or 0), 3)
+        element.clear()
+    return files
+
+
+PARSERS = {
+    EqatorTool.FLAKE8: parse_flake8,
+    EqatorTool.RADON: parse_radon,
+    EqatorTool.BANDIT: parse_bandit,
+    EqatorTool.COVERAGE: parse_coverage,
+    EqatorTool.UNITTEST: parse_unittest,
+}
+
+
+def _digest(metrics):
+    return hashlib.md5(json.dumps(metrics, sort_keys=True).encode()).hexdigest()
+
+
+def summarize(tool, files):
+    summary = {'files': len(files)}
+    for metrics in files.values():
+        for key, value in metrics.items():
+            if isinstance(value, (int, float)) and key not in NOT_SUMMED_METRICS:
+                summary[key] = summary.get(key, 0) + value
+    if tool == EqatorTool.COVERAGE and summary.get('statements'):
+        summary['percent_covered'] = round(summary['covered'] / summary['statements'] * 100, 2)
+    return summary
+
+
+def ingest_report(project_id, tool, stream, branch='', commit=''):
+    """
+    Разбирает отчёт инструмента и сохраняет метрики только изменившихся и
+    пропавших файлов относительно прошлого отчёта ветки. Состояние ветки
+    обновляется пачками.
+    """
+    files = PARSERS[tool](stream)
+    digests = {path: _digest(metrics) for path, metrics in files.items()}
+    states = {
+        path: (state_id, digest)
+        for path, state_id, digest in EqatorFileState.objects.filter(
+            project_id=project_id, branch=branch, tool=tool).values_list('path', 'id', 'digest')
+    }
+    changed = [path for path, digest in digests.items() if states.get(path, (None, None))[1] != digest]
+    removed = [path for path in states if path not in files]
+
+    with transaction.atomic():
+        report = EqatorReport.objects.create(
+            project_id=project_id, branch=branch, commit=commit, tool=tool,
+            summary=summarize(tool, files), files_count=len(files), changed_count=len(changed) + len(removed),
+        )
+        EqatorFileMetric.objects.bulk_create(
+            [EqatorFileMetric(report=report, path=path, metrics=files[path]) for path in changed]
+            + [EqatorFileMetric(report=report, path=path, removed=True) for path in removed],
+            batch_size=INGEST_BATCH_SIZE,
+        )
+        EqatorFileState.objects.bulk_create(
+            [
+                EqatorFileState(project_id=project_id, branch=branch, tool=tool, path=path,
+                                digest=digests[path], metrics=files[path])
+                for path in changed
+            ],
+            batch_size=INGEST_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['project', 'branch', 'tool', 'path'],
+            update_fields=['digest', 'metrics'],
+        )
+        removed_ids = [states[path][0] for path in removed]
+        for i in range(0, len(removed_ids), INGEST_BATCH_SIZE):
+            EqatorFileState.objects.filter(id__in=removed_ids[i:i + INGEST_BATCH_SIZE]).delete()
+    return report
+
+
+class EqatorReportIngestView(APIView):
+    """
+    Приём отчётов Eqator по URL интеграции: POST <url>?tool=<инструмент>&branch=<ветка>&commit=<коммит>,
+    в теле - отчёт инструмента как есть (можно сжать, Content-Encoding: gzip).
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request, token, *args, **kwargs):
+        project_id = get_project_id_by_token(token)
+        if project_id is None:
+            return Response({'non_field_errors': [_('Недействительный токен интеграции')]},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        tool = request.query_params.get('tool')
+        if tool not in PARSERS:
+            return Response({'non_field_errors': [_('Недопустимый параметр \'tool\'')]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        stream = request.stream
+        if stream is None:
+            return Response({'non_field_errors': [_('Пустой отчёт')]}, status=status.HTTP_400_BAD_REQUEST)
+        if request.META.get('HTTP_CONTENT_ENCODING') == 'gzip':
+            stream = gzip.GzipFile(fileobj=stream)
+        stream = LimitedStream(stream, max_report_size(tool))
+
+        try:
+            report = ingest_report(project_id, tool, stream,
+                                   branch=request.query_params.get('branch', ''),
+                                   commit=request.query_params.get('commit', ''))
+        except ReportTooLarge:
+            return Response({'non_field_errors': [_('Слишком большой отчёт')]},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except PARSE_ERRORS:
+            return Response({'non_field_errors': [_('Не удалось разобрать отчёт')]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'report': report.id,
+            'files': report.files_count,
+            'changed': report.changed_count,
+            'summary': report.summary,
+        }, status=status.HTTP_201_CREATED)
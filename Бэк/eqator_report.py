@@ -0,0 +1,79 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+from eqator_projects.models import ProjectPage
+
+
+class EqatorTool(models.TextChoices):
+    FLAKE8 = 'flake8', 'flake8'
+    RADON = 'radon', 'radon'
+    BANDIT = 'bandit', 'bandit'
+    COVERAGE = 'coverage', 'coverage'
+    UNITTEST = 'unittest', 'unittest'
+
+
+class EqatorReport(models.Model):
+    """
+    Загрузка отчёта Eqator по одному инструменту. Метрики файлов хранятся
+    только для файлов, изменившихся относительно прошлого отчёта ветки.
+    """
+    project = models.ForeignKey(ProjectPage, verbose_name=_('Проект'), on_delete=models.CASCADE,
+                                related_name='eqator_reports')
+    branch = models.CharField(verbose_name=_('Ветка'), max_length=255, default='', blank=True)
+    commit = models.CharField(verbose_name=_('Коммит'), max_length=64, default='', blank=True)
+    tool = models.CharField(verbose_name=_('Инструмент'), max_length=32, choices=EqatorTool.choices)
+    summary = models.JSONField(verbose_name=_('Итоги'), default=dict, blank=True)
+    files_count = models.PositiveIntegerField(verbose_name=_('Файлов в отчёте'), default=0)
+    changed_count = models.PositiveIntegerField(verbose_name=_('Изменившихся файлов'), default=0)
+    created_at = models.DateTimeField(verbose_name=_('Дата загрузки'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Отчёт Eqator'
+        verbose_name_plural = 'Отчёты Eqator'
+        indexes = [
+            models.Index(fields=['project', 'branch', 'tool', '-created_at'], name='eqator_report_branch_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.tool} {self.branch}@{self.commit}'
+
+
+class EqatorFileMetric(models.Model):
+    """
+    Изменение метрик файла в отчёте; removed - файл пропал из отчёта.
+    """
+    report = models.ForeignKey(EqatorReport, verbose_name=_('Отчёт'), on_delete=models.CASCADE,
+                               related_name='file_metrics')
+    path = models.CharField(verbose_name=_('Файл'), max_length=1024)
+    metrics = models.JSONField(verbose_name=_('Метрики'), default=dict, blank=True)
+    removed = models.BooleanField(verbose_name=_('Удалён'), default=False)
+
+    class Meta:
+        verbose_name = 'Метрики файла Eqator'
+        verbose_name_plural = 'Метрики файлов Eqator'
+
+    def __str__(self):
+        return self.path
+
+
+class EqatorFileState(models.Model):
+    """
+    Последние метрики файла в ветке - с ними сравнивается следующий отчёт.
+    """
+    project = models.ForeignKey(ProjectPage, verbose_name=_('Проект'), on_delete=models.CASCADE,
+                                related_name='eqator_file_states')
+    branch = models.CharField(verbose_name=_('Ветка'), max_length=255, default='', blank=True)
+    tool = models.CharField(verbose_name=_('Инструмент'), max_length=32, choices=EqatorTool.choices)
+    path = models.CharField(verbose_name=_('Файл'), max_length=1024)
+    digest = models.CharField(verbose_name=_('Хеш метрик'), max_length=32)
+    metrics = models.JSONField(verbose_name=_('Метрики'), default=dict, blank=True)
+
+    class Meta:
+        verbose_name = 'Состояние файла Eqator'
+        verbose_name_plural = 'Состояния файлов Eqator'
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'branch', 'tool', 'path'], name='eqator_file_state_unique'),
+        ]
+
+    def __str__(self):
+        return self.path
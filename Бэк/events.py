@@ -0,0 +1,154 @@
+import json
+import logging
+import queue
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.http import StreamingHttpResponse
+
+from eqator_projects.models import CaseRun
+from eqator_projects.models.auto_test_runs import AutoTestRun
+
+KEEPALIVE_TIMEOUT = 15
+
+logger = logging.getLogger('events')
+
+
+class LocalEventBroker:
+    """
+    Pub/sub в памяти процесса. Подходит для одного воркера и тестов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+    def listen(self, channel, timeout=KEEPALIVE_TIMEOUT):
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscriber)
+        try:
+            while True:
+                try:
+                    yield subscriber.get(timeout=timeout)
+                except queue.Empty:
+                    yield None
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+
+
+class RedisEventBroker:
+    """
+    Pub/sub через Redis, события видны всем воркерам.
+    """
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self._redis.publish(channel, message)
+
+    def listen(self, channel, timeout=KEEPALIVE_TIMEOUT):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(channel)
+        try:
+            while True:
+                message = pubsub.get_message(timeout=timeout)
+                yield message['data'].decode() if message else None
+        finally:
+            pubsub.close()
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    url = getattr(settings, 'EVENTS_REDIS_URL', None)
+    if url:
+        return RedisEventBroker(url)
+    return LocalEventBroker()
+
+
+def project_channel(project_id):
+    return f'project:{project_id}'
+
+
+def run_channel(run_id):
+    return f'run:{run_id}'
+
+
+def _publish(channel, message):
+    try:
+        get_broker().publish(channel, message)
+    except Exception:
+        # недоступный брокер не должен ломать запись, клиенты дочитают изменения при навигации
+        logger.exception('Failed to publish event to %s', channel)
+
+
+def publish_event(channel, event_type, data):
+    """
+    Событие уходит подписчикам после коммита транзакции, откаченные изменения не публикуются.
+    """
+    message = json.dumps({'type': event_type, 'data': data}, default=str)
+    transaction.on_commit(lambda: _publish(channel, message))
+
+
+def event_stream(channel):
+    """
+    Поток SSE. Пустые сообщения отправляются как keepalive-комментарий.
+    """
+    for message in get_broker().listen(channel):
+        if message is None:
+            yield ': keepalive\n\n'
+            continue
+        event = json.loads(message)
+        yield f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def sse_response(channel):
+    """
+    Ответ держит соединение открытым: под WSGI каждая открытая вкладка занимает
+    воркер (поток) на всё время подписки, число воркеров нужно считать с запасом.
+    """
+    response = StreamingHttpResponse(event_stream(channel), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def publish_case_run_status(case_run):
+    publish_event(run_channel(case_run.run_id), 'case_run_status', {
+        'id': case_run.id,
+        'status': case_run.status,
+        'status_updated_at': case_run.status_updated_at,
+    })
+
+
+def publish_run_progress(run, progress):
+    publish_event(run_channel(run.pk), 'run_progress', {'id': run.pk, 'progress': progress})
+    publish_event(project_channel(run.project_id), 'run_progress', {'id': run.pk, 'progress': progress})
+
+
+@receiver(post_save, sender=CaseRun)
+def case_run_saved(sender, instance, created, **kwargs):
+    if not created:
+        publish_case_run_status(instance)
+
+
+@receiver(post_save, sender=AutoTestRun)
+def auto_test_run_saved(sender, instance, created, **kwargs):
+    publish_event(project_channel(instance.project_id), 'autotest_run_created' if created else 'autotest_run_state', {
+        'id': instance.pk,
+        'stateName': instance.stateName,
+        'completedDate': instance.completedDate,
+    })
@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import QueryDict
+
+from eqator_projects.models import CasePage, ProjectPage
+from eqator_projects.models.auto_test_runs import AutoTestRun, AutoTestResults
+from eqator_projects.views.cases import CasesFilter
+
+
+class Command(BaseCommand):
+    help = 'Выполняет EXPLAIN для реальных комбинаций фильтров и отмечает последовательные сканирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', type=int, help='id проекта с данными')
+        parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE (запросы выполняются)')
+        parser.add_argument('--verbose', action='store_true', help='печатать планы целиком')
+
+    def get_case_filters(self, project):
+        case = CasePage.objects.filter(project=project).exclude(suite__isnull=True).first()
+        tag = case.tags.first() if case else None
+        base = {'project': [project.pk]}
+        combinations = [
+            {},
+            {'status': [CasePage.STATUS.APPROVED]},
+            {'priority': [CasePage.Priority.LOW]},
+            {'case_type': [CasePage.Type.TASK]},
+            {'without_suite': ['true']},
+            {'status': [CasePage.STATUS.APPROVED], 'priority': [CasePage.Priority.LOW]},
+        ]
+        if case:
+            combinations.append({'suite': [case.suite_id]})
+            combinations.append({'suite': [case.suite_id], 'status': [CasePage.STATUS.APPROVED]})
+        if tag:
+            combinations.append({'tags': [tag.pk]})
+
+        # фильтры получают данные в том же виде, что и из query string запроса
+        filters = []
+        for combination in combinations:
+            data = QueryDict(mutable=True)
+            for key, values in {**base, **combination}.items():
+                data.setlist(key, [str(value) for value in values])
+            filters.append(data)
+        return filters
+
+    def get_querysets(self, project):
+        for data in self.get_case_filters(project):
+            filterset = CasesFilter(data, queryset=CasePage.active_on_site.all())
+            if not filterset.is_valid():
+                raise CommandError(f'Некорректные фильтры {data.urlencode()}: {filterset.errors.as_json()}')
+            yield f'cases {data.urlencode()}', filterset.qs.order_by('sort', 'id')[:20]
+
+        runs = AutoTestRun.objects.filter(project=project).order_by('-createdDate')
+        yield 'auto_test_runs', runs[:20]
+        for state in AutoTestRun.TestRunState.values:
+            yield f'auto_test_runs stateName={state}', runs.filter(stateName=state)[:20]
+
+        auto_test_run = runs.first()
+        if auto_test_run:
+            results = AutoTestResults.objects.filter(auto_test_run=auto_test_run)
+            yield 'auto_test_runs_result', results[:20]
+            for outcome in AutoTestResults.STATUS.values:
+                yield f'auto_test_runs_result outcome={outcome}', results.filter(outcome=outcome)[:20]
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Аудит планов поддерживается только для PostgreSQL')
+        project = ProjectPage.objects.filter(pk=options['project']).first()
+        if project is None:
+            raise CommandError(f"Проект {options['project']} не найден")
+
+        flagged = 0
+        for name, queryset in self.get_querysets(project):
+            plan = queryset.explain(analyze=options['analyze'])
+            seq_scans = [line.strip() for line in plan.splitlines() if 'Seq Scan' in line]
+            if seq_scans:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(f'{name}: {"; ".join(seq_scans)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+            if options['verbose']:
+                self.stdout.write(plan)
+
+        self.stdout.write(f'Запросов с последовательным сканированием: {flagged}')
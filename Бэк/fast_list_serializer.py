@@ -0,0 +1,89 @@
+from operator import attrgetter
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+
+# поля, которые читаются напрямую; сравнение по точному классу, наследники с
+# собственным to_representation идут обычным путём DRF
+FAST_FIELD_CLASSES = {
+    serializers.BooleanField: bool,
+    serializers.CharField: str,
+    serializers.ChoiceField: None,
+    serializers.DateField: None,
+    serializers.DateTimeField: None,
+    serializers.FloatField: float,
+    serializers.IntegerField: int,
+    serializers.ReadOnlyField: None,
+    serializers.UUIDField: None,
+}
+
+
+class FastListSerializer(serializers.ListSerializer):
+    """
+    ListSerializer только для чтения. Функция строки собирается один раз на
+    страницу: плоские поля читаются через attrgetter, значения уже нужного типа
+    не проходят через to_representation. Вложенные, method-поля и source='*'
+    идут обычным путём DRF, формат ответа не меняется. Поля с prepare_page
+    получают всю страницу до построения строк. Если у сериализатора свой
+    to_representation, строки строит стандартный ListSerializer.
+    Подключается через Meta.list_serializer_class.
+    """
+
+    def _compile_row(self):
+        readers = []
+        for field in self.child._readable_fields:
+            field_class = type(field)
+            if field_class in FAST_FIELD_CLASSES and field.source != '*':
+                readers.append((field.field_name, attrgetter(field.source), FAST_FIELD_CLASSES[field_class], field))
+            else:
+                readers.append((field.field_name, None, None, field))
+
+        def to_row(instance):
+            ret = {}
+            for field_name, getter, native_type, field in readers:
+                try:
+                    attribute = self._get_attribute(instance, getter, field)
+                except SkipField:
+                    continue
+
+                check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+                if check_for_none is None:
+                    ret[field_name] = None
+                elif native_type is not None and type(attribute) is native_type:
+                    ret[field_name] = attribute
+                else:
+                    ret[field_name] = field.to_representation(attribute)
+            return ret
+
+        return to_row
+
+    @staticmethod
+    def _get_attribute(instance, getter, field):
+        if getter is not None:
+            try:
+                attribute = getter(instance)
+            except (AttributeError, ObjectDoesNotExist):
+                # цепочка source оборвалась - default, allow_null и ошибки решает DRF
+                pass
+            else:
+                if not callable(attribute):
+                    return attribute
+        return field.get_attribute(instance)
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        items = list(iterable)
+        # поля с prepare_page загружают данные сразу на всю страницу (теги)
+        for field in self.child._readable_fields:
+            prepare_page = getattr(field, 'prepare_page', None)
+            if prepare_page is not None:
+                prepare_page(items)
+
+        if type(self.child).to_representation is not serializers.Serializer.to_representation:
+            return super().to_representation(items)
+
+        to_row = self._compile_row()
+        return [to_row(item) for item in items]
@@ -0,0 +1,37 @@
+import django_filters
+from django import forms
+from django.db.models import Count, Exists, OuterRef
+
+
+class IdMultipleField(forms.MultipleChoiceField):
+    """
+    Список id без проверки существования в БД.
+    """
+
+    def valid_value(self, value):
+        return str(value).isdigit()
+
+    def clean(self, value):
+        return [int(item) for item in super().clean(value)]
+
+
+class TagsExistsFilter(django_filters.Filter):
+    """
+    Фильтр по тегам через EXISTS по промежуточной таблице M2M, без JOIN и DISTINCT.
+    Режим задаётся параметром tags_mode: or (любой из тегов, по умолчанию) или and (все теги).
+    Подзапрос идёт по уникальному индексу (объект, тег) промежуточной таблицы.
+    """
+    field_class = IdMultipleField
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        tag_ids = set(value)
+        field = qs.model._meta.get_field(self.field_name)
+        through = field.remote_field.through
+        source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+
+        links = through.objects.filter(**{source: OuterRef('pk'), f'{target}__in': tag_ids})
+        if self.parent.data.get('tags_mode') == 'and' and len(tag_ids) > 1:
+            links = links.order_by().values(source).annotate(matched=Count(target)).filter(matched=len(tag_ids))
+        return qs.filter(Exists(links))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from eqator_projects.models import ProjectPage
+from eqator_projects.services.project_data_factory import ProjectDataFactory
+
+
+class Command(BaseCommand):
+    help = 'Наполняет проект сгенерированными кейсами, прогонами и результатами автотестов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', type=int, help='id проекта')
+        parser.add_argument('--cases', type=int, default=1000)
+        parser.add_argument('--suites', type=int, default=10)
+        parser.add_argument('--steps', type=int, default=2, help='шагов на кейс')
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--runs', type=int, default=1)
+        parser.add_argument('--auto-test-results', type=int, default=0)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        project = ProjectPage.objects.filter(pk=options['project']).first()
+        if project is None:
+            raise CommandError(f"Проект {options['project']} не найден")
+
+        started = time.perf_counter()
+        data = ProjectDataFactory(project, seed=options['seed']).generate(
+            cases=options['cases'],
+            suites=options['suites'],
+            steps_per_case=options['steps'],
+            tags=options['tags'],
+            runs=options['runs'],
+            auto_test_results=options['auto_test_results'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано кейсов: {len(data['cases'])}, прогонов: {len(data['runs'])} "
+            f"за {time.perf_counter() - started:.1f} с"
+        ))
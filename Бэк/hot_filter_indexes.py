@@ -0,0 +1,32 @@
+from django.db import models
+from django.db.models import Q
+
+# Индексы под горячие фильтры. Подключаются в Meta.indexes соответствующих
+# моделей, миграция - migrations/hot_filter_indexes.py. Индекс может ссылаться
+# только на поля своей таблицы (models.E016), поэтому в индексах CasePage нет
+# полей BasePage (sort, created_at, is_active).
+
+CASE_PAGE_INDEXES = [
+    models.Index(fields=['project', 'status'], name='casepage_project_status_idx'),
+    models.Index(fields=['project', 'suite'], name='casepage_project_suite_idx'),
+    models.Index(fields=['project'], condition=Q(suite__isnull=True), name='casepage_without_suite_idx'),
+    models.Index(fields=['project', 'priority'], name='casepage_project_priority_idx'),
+    models.Index(fields=['project', 'case_type'], name='casepage_project_type_idx'),
+    models.Index(fields=['project', 'behavior'], name='casepage_project_behavior_idx'),
+]
+
+# Таблица BasePage принадлежит garpix_page, в её Meta индекс не добавить -
+# он создаётся операцией миграции через schema_editor.
+BASE_PAGE_INDEXES = [
+    # сортировка по умолчанию CasesView среди активных страниц - то, что отдаёт active_on_site
+    models.Index(fields=['sort', 'id'], condition=Q(is_active=True), name='basepage_active_sort_idx'),
+]
+
+AUTO_TEST_RUN_INDEXES = [
+    models.Index(fields=['project', '-createdDate'], name='autotestrun_project_date_idx'),
+    models.Index(fields=['project', 'stateName', '-createdDate'], name='autotestrun_project_state_idx'),
+]
+
+AUTO_TEST_RESULTS_INDEXES = [
+    models.Index(fields=['auto_test_run', 'outcome'], name='autotestresults_run_outcome_idx'),
+]
@@ -0,0 +1,72 @@
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный прогон GET эндпоинтов запущенного сервера: пропускная способность и задержки ' \
+           'при заданном числе одновременных запросов (сравнение WSGI и ASGI развёртывания)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='полные URL эндпоинтов')
+        parser.add_argument('--header', action='append', default=[],
+                            help='заголовок запроса, например "Authorization: Token ..."')
+        parser.add_argument('--requests', type=int, default=200, help='запросов на каждый URL')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--report', help='файл для отчёта в JSON')
+
+    def _get(self, url, headers, timeout):
+        started = time.perf_counter()
+        try:
+            with urlopen(Request(url, headers=headers), timeout=timeout) as response:
+                response.read()
+                ok = response.status == 200
+        except (HTTPError, URLError, TimeoutError):
+            ok = False
+        return ok, time.perf_counter() - started
+
+    def _run(self, url, headers, total, concurrency, timeout):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda _: self._get(url, headers, timeout), range(total)))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for ok, latency in results if ok)
+        errors = sum(1 for ok, _ in results if not ok)
+        if not latencies:
+            return {'rps': 0, 'errors': errors}
+        return {
+            'rps': len(latencies) / elapsed,
+            'p50': statistics.median(latencies),
+            'p95': latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1],
+            'errors': errors,
+        }
+
+    def handle(self, *args, **options):
+        headers = {'Accept': 'application/json'}
+        for header in options['header']:
+            name, _, value = header.partition(':')
+            headers[name.strip()] = value.strip()
+
+        report = {}
+        for url in options['urls']:
+            for concurrency in options['concurrency']:
+                if concurrency < 1:
+                    raise CommandError('--concurrency должен быть больше 0')
+                result = self._run(url, headers, options['requests'], concurrency, options['timeout'])
+                report[f'{url}[c={concurrency}]'] = result
+                self.stdout.write(
+                    f"{url} c={concurrency}: {result['rps']:.1f} rps, "
+                    f"p50 {result.get('p50', 0) * 1000:.0f} мс, p95 {result.get('p95', 0) * 1000:.0f} мс, "
+                    f"ошибок {result['errors']}"
+                )
+
+        if options['report']:
+            with open(options['report'], 'w') as report_file:
+                json.dump(report, report_file, indent=2, sort_keys=True)
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+def backfill_attachments_summary(apps, schema_editor):
+    CasePage = apps.get_model('eqator_projects', 'CasePage')
+    cases = []
+    for case in CasePage.objects.prefetch_related('attachments').only('id').iterator(chunk_size=1000):
+        attachments = sorted(case.attachments.all(), key=lambda attachment: attachment.pk)
+        if not attachments:
+            continue
+        case.attachments_count = len(attachments)
+        case.attachments_preview = attachments[0].file.name
+        cases.append(case)
+    CasePage.objects.bulk_update(cases, ['attachments_count', 'attachments_preview'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eqator_projects', 'hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='casepage',
+            name='attachments_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество вложений'),
+        ),
+        migrations.AddField(
+            model_name='casepage',
+            name='attachments_preview',
+            field=models.CharField(blank=True, default='', max_length=1024, verbose_name='Превью первого вложения'),
+        ),
+        migrations.RunPython(backfill_attachments_summary, migrations.RunPython.noop),
+    ]
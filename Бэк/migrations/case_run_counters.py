@@ -0,0 +1,59 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count_subquery(model, field, **filters):
+    if 'is_deleted' in {field.name for field in model._meta.get_fields()}:
+        filters['is_deleted'] = False
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}, **filters).order_by().values(field)
+        .annotate(count=Count('pk')).values('count')[:1]
+    ), Value(0))
+
+
+def backfill_counters(apps, schema_editor):
+    CaseRun = apps.get_model('eqator_projects', 'CaseRun')
+    CaseRunStep = apps.get_model('eqator_projects', 'CaseRunStep')
+    Comment = apps.get_model('eqator_projects', 'Comment')
+    Issue = apps.get_model('eqator_projects', 'Issue')
+
+    CaseRun.objects.update(
+        comments_count=_count_subquery(Comment, 'case_run', case_run_step__isnull=True),
+        issues_count=_count_subquery(Issue, 'case_run', case_run_step__isnull=True),
+    )
+    CaseRunStep.objects.update(
+        comments_count=_count_subquery(Comment, 'case_run_step'),
+        issues_count=_count_subquery(Issue, 'case_run_step'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eqator_projects', 'runpage_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='caserun',
+            name='comments_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Количество комментариев'),
+        ),
+        migrations.AddField(
+            model_name='caserun',
+            name='issues_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Количество задач'),
+        ),
+        migrations.AddField(
+            model_name='caserunstep',
+            name='comments_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Количество комментариев'),
+        ),
+        migrations.AddField(
+            model_name='caserunstep',
+            name='issues_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Количество задач'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
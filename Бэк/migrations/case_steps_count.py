@@ -0,0 +1,28 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_steps_count(apps, schema_editor):
+    CasePage = apps.get_model('eqator_projects', 'CasePage')
+    Step = apps.get_model('eqator_projects', 'Step')
+    CasePage.objects.update(steps_count=Coalesce(Subquery(
+        Step.objects.filter(case=OuterRef('pk')).order_by().values('case')
+        .annotate(count=Count('pk')).values('count')[:1]
+    ), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eqator_projects', 'case_run_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='casepage',
+            name='steps_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Количество шагов'),
+        ),
+        migrations.RunPython(backfill_steps_count, migrations.RunPython.noop),
+    ]
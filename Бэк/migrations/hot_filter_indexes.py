@@ -0,0 +1,68 @@
+from django.db import migrations, models
+from django.db.models import Q
+
+BASE_PAGE_INDEXES = [
+    models.Index(fields=['sort', 'id'], condition=Q(is_active=True), name='basepage_active_sort_idx'),
+]
+
+
+def add_base_page_indexes(apps, schema_editor):
+    BasePage = apps.get_model('garpix_page', 'BasePage')
+    for index in BASE_PAGE_INDEXES:
+        schema_editor.add_index(BasePage, index)
+
+
+def remove_base_page_indexes(apps, schema_editor):
+    BasePage = apps.get_model('garpix_page', 'BasePage')
+    for index in BASE_PAGE_INDEXES:
+        schema_editor.remove_index(BasePage, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        # нужна только таблица BasePage с sort/is_active - она есть с первой миграции garpix_page;
+        # __latest__ менял бы место миграции в графе при каждом обновлении пакета
+        ('garpix_page', '0001_initial'),
+        ('eqator_projects', 'case_steps_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='casepage',
+            index=models.Index(fields=['project', 'status'], name='casepage_project_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='casepage',
+            index=models.Index(fields=['project', 'suite'], name='casepage_project_suite_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='casepage',
+            index=models.Index(condition=Q(suite__isnull=True), fields=['project'], name='casepage_without_suite_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='casepage',
+            index=models.Index(fields=['project', 'priority'], name='casepage_project_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='casepage',
+            index=models.Index(fields=['project', 'case_type'], name='casepage_project_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='casepage',
+            index=models.Index(fields=['project', 'behavior'], name='casepage_project_behavior_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='autotestrun',
+            index=models.Index(fields=['project', '-createdDate'], name='autotestrun_project_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='autotestrun',
+            index=models.Index(fields=['project', 'stateName', '-createdDate'], name='autotestrun_project_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='autotestresults',
+            index=models.Index(fields=['auto_test_run', 'outcome'], name='autotestresults_run_outcome_idx'),
+        ),
+        migrations.RunPython(add_base_page_indexes, remove_base_page_indexes),
+    ]
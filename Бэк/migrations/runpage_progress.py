@@ -0,0 +1,79 @@
+import ast
+from pathlib import Path
+
+from django.db import migrations, models
+from django.db.models import Count
+
+APP_LABEL = 'eqator_projects'
+# миграции, добавленные вместе с денормализованными полями, идут одной цепочкой
+CHAIN = {'runpage_progress', 'case_run_counters', 'case_steps_count', 'hot_filter_indexes', 'case_attachments_summary'}
+
+
+def _app_dependencies(path):
+    tree = ast.parse(path.read_text(encoding='utf-8'))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and isinstance(node.value, (ast.List, ast.Tuple)) \
+                and any(getattr(target, 'id', None) == 'dependencies' for target in node.targets):
+            return {
+                item.elts[1].value for item in node.value.elts
+                if isinstance(item, ast.Tuple) and len(item.elts) == 2
+                and getattr(item.elts[0], 'value', None) == APP_LABEL
+            }
+    return set()
+
+
+def app_leaf():
+    """
+    Последняя миграция приложения, на которой строится цепочка. Миграции,
+    созданные после цепочки, зависят от неё и в расчёт не берутся, поэтому
+    план не меняется с появлением новых миграций.
+    """
+    graph = {path.stem: _app_dependencies(path) for path in Path(__file__).resolve().parent.glob('[!_]*.py')}
+    after = set(CHAIN)
+    changed = True
+    while changed:
+        changed = False
+        for name, dependencies in graph.items():
+            if name not in after and dependencies & after:
+                after.add(name)
+                changed = True
+    candidates = {name: dependencies for name, dependencies in graph.items() if name not in after}
+    leaves = set(candidates) - set().union(*candidates.values())
+    if len(leaves) != 1:
+        raise ValueError(f'Ожидалась одна последняя миграция {APP_LABEL}, найдено: {sorted(leaves)}')
+    return leaves.pop()
+
+
+def backfill_progress(apps, schema_editor):
+    RunPage = apps.get_model('eqator_projects', 'RunPage')
+    CaseRun = apps.get_model('eqator_projects', 'CaseRun')
+    statuses = CaseRun._meta.get_field('status').choices
+
+    progress = {}
+    rows = CaseRun.objects.values('run_id', 'status').annotate(count=Count('id')).order_by()
+    for row in rows.iterator():
+        run_progress = progress.setdefault(row['run_id'], {value: 0 for value, _ in statuses})
+        run_progress[row['status']] = row['count']
+
+    runs = []
+    for run in RunPage.objects.only('id').iterator():
+        run.progress = progress.get(run.id, {value: 0 for value, _ in statuses})
+        run.progress['count'] = sum(run.progress.values())
+        runs.append(run)
+    RunPage.objects.bulk_update(runs, ['progress'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (APP_LABEL, app_leaf()),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='runpage',
+            name='progress',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Прогресс'),
+        ),
+        migrations.RunPython(backfill_progress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,162 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from eqator_projects.models import CaseRun, RunPage
+from eqator_projects.serializers.case_run import CaseRunsSerializer
+
+ROLLUP_CACHE_TIMEOUT = 60 * 60
+
+# измерение отчёта -> поле прогона кейса
+ROLLUP_DIMENSIONS = {
+    'status': 'status',
+    'priority': 'priority',
+    'behavior': 'behavior',
+    'tag': 'tags',
+    'assignee': 'run__assigned_to__user',
+}
+
+
+def _version_key(milestone_id):
+    return f'milestone_rollup_version:{milestone_id}'
+
+
+def _rollup_key(milestone_id):
+    version = cache.get_or_set(_version_key(milestone_id), 1, None)
+    return f'milestone_rollup:{milestone_id}:{version}'
+
+
+def _bump_rollup_version(milestone_id):
+    try:
+        cache.incr(_version_key(milestone_id))
+    except ValueError:
+        cache.set(_version_key(milestone_id), 1, None)
+
+
+def invalidate_milestone_rollup(milestone_id):
+    """
+    Сводка сбрасывается после коммита: иначе параллельный запрос успеет
+    собрать и закешировать её по данным до изменения.
+    """
+    if milestone_id:
+        transaction.on_commit(lambda: _bump_rollup_version(milestone_id))
+
+
+def milestone_case_runs(milestone):
+    return CaseRun.objects.filter(run__milestone=milestone)
+
+
+def build_milestone_rollup(milestone):
+    """
+    Сводка по майлстоуну: количество прогонов кейсов по статусам в разрезе
+    каждого измерения, считается агрегатами в БД.
+    """
+    case_runs = milestone_case_runs(milestone).order_by()
+    totals = {row['status']: row['count'] for row in case_runs.values('status').annotate(count=Count('id'))}
+    rollup = {'count': sum(totals.values()), 'statuses': totals, 'dimensions': {}}
+
+    for dimension, field in ROLLUP_DIMENSIONS.items():
+        if dimension == 'status':
+            continue
+        groups = {}
+        for row in case_runs.values(field, 'status').annotate(count=Count('id', distinct=True)):
+            group = groups.setdefault(row[field], {'value': row[field], 'count': 0, 'statuses': {}})
+            group['statuses'][row['status']] = row['count']
+            group['count'] += row['count']
+        rollup['dimensions'][dimension] = list(groups.values())
+    return rollup
+
+
+def get_milestone_rollup(milestone):
+    key = _rollup_key(milestone.pk)
+    rollup = cache.get(key)
+    if rollup is None:
+        rollup = build_milestone_rollup(milestone)
+        cache.set(key, rollup, ROLLUP_CACHE_TIMEOUT)
+    return rollup
+
+
+@receiver(post_save, sender=CaseRun)
+@receiver(post_delete, sender=CaseRun)
+def case_run_changed(sender, instance, **kwargs):
+    invalidate_milestone_rollup(instance.run.milestone_id)
+
+
+@receiver(pre_save, sender=RunPage)
+def run_pre_save(sender, instance, using, **kwargs):
+    # майлстоун и исполнитель до сохранения - от них зависят сводки
+    instance._rollup_previous = None if instance._state.adding else \
+        sender._base_manager.db_manager(using).filter(pk=instance.pk) \
+        .values_list('milestone_id', 'assigned_to_id').first()
+
+
+@receiver(post_save, sender=RunPage)
+def run_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is None or previous == (instance.milestone_id, instance.assigned_to_id):
+        return
+    invalidate_milestone_rollup(instance.milestone_id)
+    if previous[0] != instance.milestone_id:
+        invalidate_milestone_rollup(previous[0])
+
+
+def _case_runs_milestone_ids(case_runs):
+    return set(case_runs.exclude(run__milestone__isnull=True).values_list('run__milestone_id', flat=True).distinct())
+
+
+@receiver(m2m_changed, sender=CaseRun.tags.through)
+def case_run_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_milestone_rollup(instance.run.milestone_id)
+        return
+    # со стороны тега post_clear приходит без pk_set - прогоны кейсов запоминаются до очистки
+    if action == 'pre_clear':
+        instance._rollup_milestone_ids = _case_runs_milestone_ids(CaseRun.objects.filter(tags=instance))
+        return
+    if action == 'post_clear':
+        milestone_ids = getattr(instance, '_rollup_milestone_ids', ())
+    elif action in ('post_add', 'post_remove'):
+        milestone_ids = _case_runs_milestone_ids(CaseRun.objects.filter(id__in=pk_set or ()))
+    else:
+        return
+    for milestone_id in milestone_ids:
+        invalidate_milestone_rollup(milestone_id)
+
+
+class MilestoneReportMixin:
+    """
+    Отчёт майлстоуна для вьюсета майлстоунов: сводка без загрузки прогонов
+    кейсов и постраничная детализация по одному значению измерения.
+    """
+
+    @action(methods=['GET'], detail=True, filterset_class=None, search_fields=None)
+    def rollup(self, request, pk, *args, **kwargs):
+        return Response(get_milestone_rollup(self.get_object()))
+
+    @action(methods=['GET'], detail=True, filterset_class=None, search_fields=None)
+    def rollup_case_runs(self, request, pk, *args, **kwargs):
+        milestone = self.get_object()
+        dimension = request.query_params.get('dimension')
+        if dimension not in ROLLUP_DIMENSIONS:
+            return Response({'non_field_errors': [_('Недопустимый параметр \'dimension\'')]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        value = request.query_params.get('value') or None
+        queryset = milestone_case_runs(milestone).filter(**{ROLLUP_DIMENSIONS[dimension]: value}) \
+            .select_related('case', 'original_update_by') \
+            .order_by('id').distinct()
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = CaseRunsSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = CaseRunsSerializer(queryset, many=True)
+        return Response(serializer.data)
@@ -0,0 +1,301 @@
+import pickle
+import threading
+import time
+from collections import Counter, defaultdict
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Count
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from app.celery import app as celery_app
+from content.models.tags import Tags
+from eqator_projects.models import CasePage, CaseRun, RunPage, Suite, UserProject, UserProjectRole
+from eqator_projects.models.auto_test_runs import AutoTestRun
+from eqator_projects.serializers.tag_lookup import tag_cache
+
+PROJECT_CACHE_TIMEOUT = 60 * 60
+# не чаще раза в столько секунд прогрев одного проекта
+PROJECT_WARM_INTERVAL = 60
+
+_missing = object()
+
+
+def _version_key(project_id):
+    return f'project_version:{project_id}'
+
+
+def _changed_at_key(project_id):
+    return f'project_changed_at:{project_id}'
+
+
+def get_project_version(project_id):
+    return cache.get_or_set(_version_key(project_id), 1, None)
+
+
+def get_project_versions(project_ids):
+    """
+    {id проекта: (версия, время последнего изменения или None)} одним обращением к кешу.
+    """
+    keys = [key for project_id in project_ids for key in (_version_key(project_id), _changed_at_key(project_id))]
+    values = cache.get_many(keys)
+    versions = {}
+    for project_id in project_ids:
+        version = values.get(_version_key(project_id))
+        if version is None:
+            version = get_project_version(project_id)
+        versions[project_id] = (version, values.get(_changed_at_key(project_id)))
+    return versions
+
+
+def _bump_project_version(project_id):
+    try:
+        cache.incr(_version_key(project_id))
+    except ValueError:
+        cache.set(_version_key(project_id), 1, None)
+    cache.set(_changed_at_key(project_id), timezone.now(), None)
+
+
+def bump_project_version(project_id):
+    """
+    Версия увеличивается после коммита: иначе параллельный запрос успеет
+    собрать кеш по данным до изменения и сохранить его под новой версией.
+    """
+    if project_id:
+        transaction.on_commit(partial(_bump_project_version, project_id))
+
+
+def bump_case_projects(case_ids):
+    """
+    Версии проектов кейсов, изменённых массовыми UPDATE без сигналов.
+    """
+    case_ids = [case_id for case_id in set(case_ids) if case_id]
+    if not case_ids:
+        return
+    for project_id in CasePage.objects.filter(id__in=case_ids).values_list('project_id', flat=True).distinct():
+        bump_project_version(project_id)
+
+
+@receiver(post_save, sender=CasePage)
+@receiver(post_delete, sender=CasePage)
+@receiver(post_save, sender=Suite)
+@receiver(post_delete, sender=Suite)
+@receiver(post_save, sender=RunPage)
+@receiver(post_delete, sender=RunPage)
+@receiver(post_save, sender=UserProject)
+@receiver(post_delete, sender=UserProject)
+@receiver(post_save, sender=UserProjectRole)
+@receiver(post_delete, sender=UserProjectRole)
+@receiver(post_delete, sender=AutoTestRun)
+def project_data_changed(sender, instance, **kwargs):
+    bump_project_version(instance.project_id)
+
+
+@receiver(post_save, sender=CaseRun)
+@receiver(post_delete, sender=CaseRun)
+def project_case_run_changed(sender, instance, **kwargs):
+    bump_project_version(instance.run.project_id)
+
+
+@receiver(m2m_changed, sender=CasePage.tags.through)
+def project_case_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_project_version(instance.project_id)
+        return
+    for project_id in CasePage.objects.filter(id__in=pk_set or ()).values_list('project_id', flat=True).distinct():
+        bump_project_version(project_id)
+
+
+def _tag_project_ids(tag_id):
+    field = CasePage._meta.get_field('tags')
+    return set(field.remote_field.through.objects.filter(**{f'{field.m2m_reverse_field_name()}_id': tag_id})
+               .values_list(f'{field.m2m_field_name()}__project_id', flat=True).distinct())
+
+
+@receiver(pre_delete, sender=Tags)
+def project_tag_deleting(sender, instance, **kwargs):
+    # связи с кейсами удаляются каскадом до post_delete, проекты собираются заранее
+    instance._project_ids = _tag_project_ids(instance.pk)
+
+
+@receiver(post_save, sender=Tags)
+@receiver(post_delete, sender=Tags)
+def project_tag_changed(sender, instance, created=False, **kwargs):
+    # в кеше 'tags' лежат сериализованные теги - переименование меняет данные проектов, где тег используется
+    project_ids = getattr(instance, '_project_ids', None)
+    if project_ids is None:
+        project_ids = () if created else _tag_project_ids(instance.pk)
+    for project_id in project_ids:
+        bump_project_version(project_id)
+
+
+class ProjectCacheRegistry:
+    """
+    Кеши уровня проекта. Значение строится функцией от id проекта и хранится
+    под версией проекта, которую сигналы увеличивают при любом изменении.
+    Статистика попаданий и размеров - в рамках процесса.
+    """
+
+    def __init__(self, timeout=PROJECT_CACHE_TIMEOUT):
+        self._timeout = timeout
+        self._builders = {}
+        self._lock = threading.Lock()
+        self._counters = defaultdict(Counter)
+        self._sizes = defaultdict(dict)
+        self._warmed = 0
+
+    def register(self, name):
+        def decorator(builder):
+            self._builders[name] = builder
+            return builder
+        return decorator
+
+    @staticmethod
+    def _key(name, project_id, version):
+        return f'project_cache:{name}:{project_id}:{version}'
+
+    def _build(self, name, project_id, version):
+        started = time.perf_counter()
+        value = self._builders[name](project_id)
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        cache.set(self._key(name, project_id, version), value, self._timeout)
+        with self._lock:
+            self._counters[name]['build_time'] += time.perf_counter() - started
+            self._sizes[name][project_id] = size
+        return value
+
+    def get(self, name, project_id):
+        version = get_project_version(project_id)
+        value = cache.get(self._key(name, project_id, version), _missing)
+        with self._lock:
+            self._counters[name]['misses' if value is _missing else 'hits'] += 1
+        if value is _missing:
+            value = self._build(name, project_id, version)
+        return value
+
+    def warm(self, project_id, names=None):
+        version = get_project_version(project_id)
+        keys = {name: self._key(name, project_id, version) for name in names or self._builders}
+        cached = cache.get_many(list(keys.values()))
+        for name, key in keys.items():
+            if key not in cached:
+                self._build(name, project_id, version)
+        with self._lock:
+            self._warmed += 1
+
+    def stats(self):
+        with self._lock:
+            counters = {name: dict(values) for name, values in self._counters.items()}
+            sizes = {name: dict(values) for name, values in self._sizes.items()}
+            warmed = self._warmed
+        result = {'warmed_projects': warmed, 'caches': {}}
+        for name in self._builders:
+            values = counters.get(name, {})
+            hits, misses = values.get('hits', 0), values.get('misses', 0)
+            result['caches'][name] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else 0,
+                'build_time': values.get('build_time', 0.0),
+                'projects': len(sizes.get(name, {})),
+                'bytes': sum(sizes.get(name, {}).values()),
+            }
+        return result
+
+    def reset_stats(self):
+        with self._lock:
+            self._counters.clear()
+            self._sizes.clear()
+            self._warmed = 0
+
+
+project_caches = ProjectCacheRegistry()
+
+
+@project_caches.register('suite_tree')
+def build_suite_tree(project_id):
+    return list(Suite.objects.filter(project_id=project_id).order_by('id').values())
+
+
+@project_caches.register('tags')
+def build_project_tags(project_id):
+    field = CasePage._meta.get_field('tags')
+    tag_ids = field.remote_field.through.objects \
+        .filter(**{f'{field.m2m_field_name()}__project_id': project_id}) \
+        .order_by().values_list(f'{field.m2m_reverse_field_name()}_id', flat=True).distinct()
+    tags = tag_cache.get_many(list(tag_ids))
+    return sorted(tags.values(), key=lambda tag: tag['id'])
+
+
+@project_caches.register('abac_roles')
+def build_abac_roles(project_id):
+    """
+    Участники проекта с ролями по id пользователя; сбрасывается сигналами
+    UserProject и UserProjectRole через версию проекта.
+    """
+    return {
+        user_project.user_id: user_project
+        for user_project in UserProject.active_objects.filter(project_id=project_id).select_related('abac_role')
+    }
+
+
+@project_caches.register('case_ordering')
+def build_case_ordering(project_id):
+    ordering = {}
+    cases = CasePage.active_on_site.filter(project_id=project_id).order_by('sort', 'id').values_list('suite_id', 'id')
+    for suite_id, case_id in cases:
+        ordering.setdefault(suite_id, []).append(case_id)
+    return ordering
+
+
+@project_caches.register('milestone_summaries')
+def build_milestone_summaries(project_id):
+    summaries = {}
+    rows = CaseRun.objects.filter(run__project_id=project_id, run__milestone__isnull=False) \
+        .values('run__milestone_id', 'status').annotate(count=Count('id')).order_by()
+    for row in rows:
+        summary = summaries.setdefault(row['run__milestone_id'], {'count': 0, 'statuses': {}})
+        summary['statuses'][row['status']] = row['count']
+        summary['count'] += row['count']
+    return summaries
+
+
+@celery_app.task
+def warm_project_caches_task(project_id):
+    project_caches.warm(project_id)
+
+
+def ensure_project_warm(project_id):
+    """
+    При первом обращении к проекту (и не чаще PROJECT_WARM_INTERVAL) ставит прогрев в фон.
+    """
+    if project_id and cache.add(f'project_cache_warm:{project_id}', True, PROJECT_WARM_INTERVAL):
+        transaction.on_commit(lambda: warm_project_caches_task.delay(project_id))
+
+
+class ProjectCacheWarmMixin:
+    """
+    Для вьюсетов проекта: запрос с project в параметрах или в URL прогревает кеши проекта.
+    """
+    project_lookup_param = 'project'
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        project_id = request.query_params.get(self.project_lookup_param) or kwargs.get(self.project_lookup_param)
+        if str(project_id or '').isdigit():
+            ensure_project_warm(int(project_id))
+
+
+class ProjectCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(project_caches.stats())
@@ -0,0 +1,168 @@
+import random
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, router, transaction
+from django.db.models import Max
+
+from content.models.tags import Tags
+from eqator_projects.models import (
+    CasePage, CaseRun, CaseRunStep, MilestonePage, RunPage, Step, Suite
+)
+from eqator_projects.models.auto_test_runs import AutoTestRun, AutoTestResults
+from eqator_projects.services.approximate_counts import bump_model_counts
+from eqator_projects.services.case_ordering import SORT_GAP
+from eqator_projects.services.project_cache import bump_project_version
+
+BATCH_SIZE = 1000
+
+
+class ProjectDataFactory:
+    """
+    Быстрая генерация больших проектов одной транзакцией. Кейсы - наследники
+    BasePage с MPTT: строки всех таблиц цепочки наследования вставляются пачками
+    с заранее выделенными pk и посчитанными полями дерева (каждый кейс - корень
+    своего дерева, как при save()). Сьюты создаются через save(), их единицы.
+    Обычные модели (шаги, теги, прогоны кейсов, результаты) - через bulk_create.
+    Сигналы при пачках не шлются, поэтому версии кешей count и проекта
+    увеличиваются явно. Один и тот же seed даёт одинаковые данные.
+    """
+
+    def __init__(self, project, seed=0, batch_size=BATCH_SIZE):
+        self.project = project
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+
+    def _bulk_create(self, model, objects):
+        return model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    @staticmethod
+    def _allocate_pks(model, count, using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                [model._meta.db_table, model._meta.pk.column, count],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def _bulk_create_pages(self, model, pages):
+        """
+        bulk_create не работает с multi-table наследованием, поэтому строки
+        вставляются по таблицам от корня (BasePage) к самой модели с одними и
+        теми же pk.
+        """
+        if not pages:
+            return pages
+        using = router.db_for_write(model)
+        chain = [*reversed(model._meta.get_parent_list()), model]
+        root = chain[0]
+        mptt = model._mptt_meta
+        pks = self._allocate_pks(root, len(pages), using)
+        max_tree_id = root._base_manager.using(using).aggregate(value=Max(mptt.tree_id_attr))['value'] or 0
+        content_type = ContentType.objects.db_manager(using).get_for_model(model, for_concrete_model=False)
+
+        for index, (pk, page) in enumerate(zip(pks, pages), 1):
+            for chain_model in chain:
+                setattr(page, chain_model._meta.pk.attname, pk)
+            setattr(page, f'{mptt.parent_attr}_id', None)
+            setattr(page, mptt.tree_id_attr, max_tree_id + index)
+            setattr(page, mptt.left_attr, 1)
+            setattr(page, mptt.right_attr, 2)
+            setattr(page, mptt.level_attr, 0)
+            if hasattr(page, 'polymorphic_ctype_id'):
+                page.polymorphic_ctype_id = content_type.id
+
+        for chain_model in chain:
+            fields = chain_model._meta.local_concrete_fields
+            for start in range(0, len(pages), self.batch_size):
+                chain_model._base_manager._insert(pages[start:start + self.batch_size], fields=fields, using=using)
+
+        for page in pages:
+            page._state.adding = False
+            page._state.db = using
+        bump_model_counts(model)
+        return pages
+
+    def create_tags(self, count):
+        return self._bulk_create(Tags, [Tags(title=f'Tag {i}') for i in range(1, count + 1)])
+
+    def create_suites(self, count):
+        return [Suite.objects.create(project=self.project, title=f'Suite {i}') for i in range(1, count + 1)]
+
+    def create_cases(self, count, suites=(), tags=(), steps_per_case=0, tags_per_case=1):
+        code = getattr(self.project, 'code', None) or self.project.slug
+        offset = CasePage.objects.filter(project=self.project).count()
+        cases = self._bulk_create_pages(CasePage, [
+            CasePage(
+                project=self.project,
+                title=f'Case {offset + i}',
+                slug=f'{code}-C-{offset + i}',
+                suite=self.random.choice(suites) if suites else None,
+                priority=self.random.choice(CasePage.Priority.values),
+                status=CasePage.STATUS.APPROVED,
+                sort=(offset + i) * SORT_GAP,
+            )
+            for i in range(1, count + 1)
+        ])
+
+        self._bulk_create(Step, [
+            Step(case=case, number=number, description=f'Step {number}', expected_result='')
+            for case in cases for number in range(1, steps_per_case + 1)
+        ])
+        if tags:
+            through = CasePage.tags.through
+            self._bulk_create(through, [
+                through(casepage_id=case.id, tags_id=tag.id)
+                for case in cases for tag in self.random.sample(list(tags), min(tags_per_case, len(tags)))
+            ])
+        return cases
+
+    def create_run(self, cases, milestone=None, title='Run'):
+        statuses = [self.random.choice(CaseRun.CaseStatus.values) for _ in cases]
+        # прогресс считается здесь же, как его посчитал бы get_run_progress
+        progress = {value: 0 for value in CaseRun.CaseStatus.values}
+        for case_status in statuses:
+            progress[case_status] += 1
+        progress['count'] = len(statuses)
+
+        run = RunPage.objects.create(project=self.project, title=title, milestone=milestone, progress=progress)
+        case_runs = self._bulk_create(CaseRun, [
+            CaseRun(run=run, case=case, title=case.title, priority=case.priority, status=case_status)
+            for case, case_status in zip(cases, statuses)
+        ])
+        steps = {}
+        for step in Step.objects.filter(case__in=cases).values('case_id', 'number', 'description', 'expected_result'):
+            steps.setdefault(step['case_id'], []).append(step)
+        self._bulk_create(CaseRunStep, [
+            CaseRunStep(case_run=case_run, number=step['number'], description=step['description'],
+                        expected_result=step['expected_result'])
+            for case_run in case_runs for step in steps.get(case_run.case_id, [])
+        ])
+        return run, case_runs
+
+    def create_auto_test_run(self, results_count, name='Auto Run'):
+        auto_test_run = AutoTestRun.objects.create(project=self.project, name=name)
+        self._bulk_create(AutoTestResults, [
+            AutoTestResults(auto_test_run=auto_test_run, title=f'Result {i}', autoTestExternalId=str(i),
+                            outcome=self.random.choice(AutoTestResults.STATUS.values))
+            for i in range(1, results_count + 1)
+        ])
+        return auto_test_run
+
+    @transaction.atomic
+    def generate(self, cases=1000, suites=10, steps_per_case=2, tags=10, runs=1, auto_test_results=0):
+        tag_objects = self.create_tags(tags)
+        suite_objects = self.create_suites(suites)
+        case_objects = self.create_cases(cases, suites=suite_objects, tags=tag_objects, steps_per_case=steps_per_case)
+        milestone = MilestonePage.objects.create(project=self.project, title='Milestone')
+        run_objects = [self.create_run(case_objects, milestone=milestone, title=f'Run {i}')[0]
+                       for i in range(1, runs + 1)]
+        auto_test_run = self.create_auto_test_run(auto_test_results) if auto_test_results else None
+        bump_project_version(self.project.id)
+        return {
+            'tags': tag_objects,
+            'suites': suite_objects,
+            'cases': case_objects,
+            'milestone': milestone,
+            'runs': run_objects,
+            'auto_test_run': auto_test_run,
+        }
@@ -12,6 +12,11 @@
 
         queryset = AutoTestRun.objects.filter(project=pk).order_by('-createdDate')
         queryset = self.filter_queryset(queryset)
+        return self.conditional_response(request, queryset, lambda: self._auto_test_runs_response(queryset),
+                                         fields=('createdDate', 'startedDate', 'completedDate'),
+                                         state_field='stateName')
+
+    def _auto_test_runs_response(self, queryset):
         page = self.paginate_queryset(queryset)
 
         if page is not None:
@@ -23,9 +28,11 @@
 
     @action(methods=['GET'], detail=True, url_path='auto_test_runs/(?P<auto_test_run_pk>[^/.]+)')
     def auto_test_runs_detail(self, request, pk, auto_test_run_pk, *args, **kwargs):
-        queryset = AutoTestRun.objects.filter(pk=auto_test_run_pk).first()
-        serializer = AutoTestRunDetailSerializer(queryset)
-        return Response(serializer.data)
+        queryset = AutoTestRun.objects.filter(pk=auto_test_run_pk)
+        return self.conditional_response(
+            request, queryset, lambda: Response(AutoTestRunDetailSerializer(queryset.first()).data),
+            fields=('createdDate', 'startedDate', 'completedDate'), state_field='stateName'
+        )
 
     @extend_schema(parameters=[
         OpenApiParameter(name='q', type=str, description='Search by name'),
@@ -38,7 +45,8 @@
             detail=True,
             url_path='auto_test_runs/(?P<auto_test_run_pk>[^/.]+)/result',
             filterset_class=AutoTestRunResultFilter,
-            search_fields=['title', 'autoTestExternalId']
+            search_fields=['title', 'autoTestExternalId'],
+            pagination_class=ApproximateCountPagination
             )
     def auto_test_runs_result(self, request, pk, auto_test_run_pk, *args, **kwargs):
         queryset = AutoTestResults.objects.filter(auto_test_run__pk=auto_test_run_pk)
@@ -85,3 +93,8 @@
 
         serializer = AutoTestDetailSrializer(queryset)
         return Response(serializer.data)
+
+    @action(methods=['GET'], detail=True, filterset_class=None, search_fields=None)
+    def events(self, request, pk, *args, **kwargs):
+        project = self.get_object()
+        return sse_response(project_channel(project.pk))
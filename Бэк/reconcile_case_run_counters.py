@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from eqator_projects.models import CaseRun
+from eqator_projects.services.case_run_counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает comments_count и issues_count у прогонов кейсов и шагов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--run', type=int, help='id прогона, по умолчанию все')
+
+    def handle(self, *args, **options):
+        case_runs = CaseRun.objects.all()
+        if options['run']:
+            case_runs = case_runs.filter(run_id=options['run'])
+        reconcile_counters(case_runs)
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,270 @@
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger('request_metrics')
+
+WINDOW_SIZE = getattr(settings, 'REQUEST_METRICS_WINDOW', 1000)
+SLOW_REQUEST_MS = getattr(settings, 'REQUEST_METRICS_SLOW_MS', 1000)
+SLOW_SAMPLE_RATE = getattr(settings, 'REQUEST_METRICS_SLOW_SAMPLE_RATE', 0.1)
+PERCENTILES = (50, 95, 99)
+
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SQL_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+def normalize_sql(sql):
+    """
+    Заменяет литералы на ?, чтобы одинаковые запросы с разными параметрами совпадали.
+    """
+    sql = _SQL_STRING.sub('?', sql)
+    sql = _SQL_NUMBER.sub('?', sql)
+    return _SQL_IN_LIST.sub('(...)', sql)
+
+
+class QueryRecorder:
+    """
+    Запросы одного HTTP-запроса по всем базам, в т.ч. из потоков sync_to_async.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+
+    def add(self, sql, duration):
+        sql = normalize_sql(sql)
+        with self._lock:
+            self.time += duration
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        with self._lock:
+            return {sql: count for sql, count in self.statements.items() if count > 1}
+
+
+# текущий recorder запроса; контекст копируется в потоки sync_to_async
+_current_recorder = ContextVar('request_metrics_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = _current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add(sql, time.perf_counter() - started)
+
+
+def instrument_connection(db_connection):
+    if record_query not in db_connection.execute_wrappers:
+        db_connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def connection_created_handler(sender, connection, **kwargs):
+    # соединения реплики и рабочих потоков создаются вне middleware
+    instrument_connection(connection)
+
+
+class MetricsRegistry:
+    """
+    Скользящее окно последних замеров на каждое действие вьюсета.
+    """
+    METRICS = ('total', 'db_time', 'serialization_time', 'render_time', 'queries', 'duplicate_queries')
+
+    def __init__(self, window_size=WINDOW_SIZE):
+        self._lock = threading.Lock()
+        self._window_size = window_size
+        self._samples = defaultdict(lambda: {metric: deque(maxlen=self._window_size) for metric in self.METRICS})
+        self._requests = Counter()
+
+    def record(self, key, **values):
+        with self._lock:
+            self._requests[key] += 1
+            samples = self._samples[key]
+            for metric, value in values.items():
+                samples[metric].append(value)
+
+    @staticmethod
+    def _percentile(values, percent):
+        if not values:
+            return 0
+        values = sorted(values)
+        index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+        return values[index]
+
+    def snapshot(self):
+        with self._lock:
+            samples = {key: {metric: list(values) for metric, values in metrics.items()}
+                       for key, metrics in self._samples.items()}
+            requests = dict(self._requests)
+        return {
+            key: {
+                'requests': requests[key],
+                **{
+                    f'{metric}_p{percent}': self._percentile(values, percent)
+                    for metric, values in metrics.items() for percent in PERCENTILES
+                },
+            }
+            for key, metrics in samples.items()
+        }
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._requests.clear()
+
+
+metrics_registry = MetricsRegistry()
+
+
+def get_view_key(view_func, method):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(method.lower(), method.lower())}'
+
+
+class RequestMetricsMiddleware:
+    """
+    Считает запросы к БД по всем базам (в т.ч. повторяющиеся), время БД,
+    сериализации, рендера и общее время ответа по каждому действию вьюсета.
+    Время сериализации - время работы вьюхи без запросов к БД: сериализаторы
+    выполняются внутри действия, отдельно от рендера ответа. Работает и под ASGI
+    без перехода в поток: при асинхронной цепочке middleware сам становится корутиной.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder, token, started = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_recorder.reset(token)
+        return self._finish(request, recorder, started, response)
+
+    async def __acall__(self, request):
+        recorder, token, started = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_recorder.reset(token)
+        return self._finish(request, recorder, started, response)
+
+    @staticmethod
+    def _start(request):
+        for db_connection in connections.all():
+            instrument_connection(db_connection)
+        recorder = QueryRecorder()
+        request._metrics_recorder = recorder
+        token = _current_recorder.set(recorder)
+        return recorder, token, time.perf_counter()
+
+    @staticmethod
+    def _finish(request, recorder, started, response):
+        total = time.perf_counter() - started
+
+        key = getattr(request, '_metrics_view_key', None)
+        if key is None:
+            return response
+
+        metrics_registry.record(
+            key,
+            total=total,
+            db_time=recorder.time,
+            serialization_time=getattr(request, '_metrics_serialization_time', 0.0),
+            render_time=getattr(request, '_metrics_render_time', 0.0),
+            queries=recorder.count,
+            duplicate_queries=sum(count - 1 for count in recorder.duplicates.values()),
+        )
+        if total * 1000 >= SLOW_REQUEST_MS and random.random() < SLOW_SAMPLE_RATE:
+            logger.warning('Slow request %s %s (%s): %.0f ms, %d queries, %.0f ms in DB, duplicates: %s, sql: %s',
+                           request.method, request.get_full_path(), key, total * 1000, recorder.count,
+                           recorder.time * 1000, recorder.duplicates, list(recorder.statements))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view_key = get_view_key(view_func, request.method)
+        request._metrics_view_started = (time.perf_counter(), request._metrics_recorder.time)
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+        view_started, db_time = getattr(request, '_metrics_view_started', (started, 0.0))
+        request._metrics_serialization_time = max(
+            started - view_started - (request._metrics_recorder.time - db_time), 0.0
+        )
+
+        def finish_render(rendered_response):
+            request._metrics_render_time = time.perf_counter() - started
+
+        response.add_post_render_callback(finish_render)
+        return response
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(snapshot):
+    lines = [
+        '# HELP request_metrics_requests_total Requests per view action.',
+        '# TYPE request_metrics_requests_total counter',
+    ]
+    for key, values in sorted(snapshot.items()):
+        view, _, action = key.partition('.')
+        labels = f'view="{_label(view)}",action="{_label(action)}"'
+        lines.append(f'request_metrics_requests_total{{{labels}}} {values["requests"]}')
+    for metric in MetricsRegistry.METRICS:
+        lines.append(f'# HELP request_metrics_{metric} Rolling window percentiles of {metric} per view action.')
+        lines.append(f'# TYPE request_metrics_{metric} gauge')
+        for key, values in sorted(snapshot.items()):
+            view, _, action = key.partition('.')
+            labels = f'view="{_label(view)}",action="{_label(action)}"'
+            for percent in PERCENTILES:
+                quantile = percent / 100
+                lines.append(
+                    f'request_metrics_{metric}{{{labels},quantile="{quantile}"}} {values[f"{metric}_p{percent}"]}'
+                )
+    return '\n'.join(lines) + '\n'
+
+
+class RequestMetricsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        snapshot = metrics_registry.snapshot()
+        if request.query_params.get('output') == 'prometheus':
+            return HttpResponse(render_prometheus(snapshot), content_type='text/plain; version=0.0.4')
+        return Response(snapshot)
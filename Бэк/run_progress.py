@@ -0,0 +1,12 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class RunProgressMixin(models.Model):
+    """
+    Прогресс прогона по статусам прогонов кейсов, пересчитывается раз на пачку смен статусов.
+    """
+    progress = models.JSONField(verbose_name=_('Прогресс'), default=dict, blank=True)
+
+    class Meta:
+        abstract = True
@@ -0,0 +1,19 @@
+
+    @extend_schema(request=CaseRunStatusBatchSerializer)
+    @action(methods=['POST'], detail=True, filterset_class=None, search_fields=None)
+    def change_status_batch(self, request, pk, *args, **kwargs):
+        run = self.get_object()
+        serializer = CaseRunStatusBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        items = serializer.validated_data['items']
+        errors, progress = apply_status_batch(run, items, request.user)
+        if errors:
+            return Response({'items': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'updated': len(items), 'progress': progress})
+
+    @action(methods=['GET'], detail=True, filterset_class=None, search_fields=None)
+    def events(self, request, pk, *args, **kwargs):
+        run = self.get_object()
+        return sse_response(run_channel(run.pk))
@@ -0,0 +1,87 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import serializers
+
+from content.models.tags import Tags
+from eqator_projects.serializers.tag import TagSerializer
+
+TAG_CACHE_TIMEOUT = 60 * 60
+
+
+class TagCache:
+    """
+    Кеш сериализованных тегов по id в общем бэкенде кеша. Ключи содержат
+    версию, изменение любого тега увеличивает её во всех процессах сразу.
+    """
+    version_key = 'tag_cache_version'
+
+    def __init__(self, timeout=TAG_CACHE_TIMEOUT):
+        self._timeout = timeout
+
+    def _keys(self, tag_ids):
+        version = cache.get_or_set(self.version_key, 1, None)
+        return {f'tag:{version}:{tag_id}': tag_id for tag_id in tag_ids}
+
+    def get_many(self, tag_ids):
+        keys = self._keys(set(tag_ids))
+        found = {keys[key]: item for key, item in cache.get_many(list(keys)).items()}
+        missing = set(keys.values()) - found.keys()
+        if missing:
+            loaded = {tag['id']: tag for tag in TagSerializer(Tags.objects.filter(id__in=missing), many=True).data}
+            cache.set_many({key: loaded[tag_id] for key, tag_id in keys.items() if tag_id in loaded}, self._timeout)
+            found.update(loaded)
+        return found
+
+    def clear(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 1, None)
+
+
+tag_cache = TagCache()
+
+
+@receiver(post_save, sender=Tags)
+@receiver(post_delete, sender=Tags)
+def tag_changed(sender, **kwargs):
+    transaction.on_commit(tag_cache.clear)
+
+
+class CachedTagsField(serializers.Field):
+    """
+    Теги объекта из общего кеша. В списке (FastListSerializer) id тегов всей
+    страницы читаются одним запросом к промежуточной таблице, сами теги - одним
+    get_many из кеша; строки Tags не загружаются. Для одного объекта - то же на одну строку.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+        self._page_tags = {}
+
+    @staticmethod
+    def _load(instances):
+        field = type(instances[0])._meta.get_field('tags')
+        through = field.remote_field.through
+        object_column, tag_column = f'{field.m2m_field_name()}_id', f'{field.m2m_reverse_field_name()}_id'
+
+        tag_ids = {instance.pk: [] for instance in instances}
+        rows = through.objects.filter(**{f'{object_column}__in': list(tag_ids)}) \
+            .order_by(object_column, tag_column).values_list(object_column, tag_column)
+        for object_id, tag_id in rows:
+            tag_ids[object_id].append(tag_id)
+
+        tags = tag_cache.get_many({tag_id for ids in tag_ids.values() for tag_id in ids})
+        return {object_id: [tags[tag_id] for tag_id in ids if tag_id in tags] for object_id, ids in tag_ids.items()}
+
+    def prepare_page(self, instances):
+        self._page_tags = self._load(instances) if instances else {}
+
+    def to_representation(self, instance):
+        if instance.pk not in self._page_tags:
+            return self._load([instance])[instance.pk]
+        return self._page_tags[instance.pk]
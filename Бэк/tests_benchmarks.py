@@ -0,0 +1,140 @@
+import json
+import os
+import time
+import tracemalloc
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import serializers
+
+from eqator_projects.models import CasePage, CaseRun, RunPage, UserProject, UserProjectRole
+from eqator_projects.models.auto_test_runs import AutoTestRun
+from eqator_projects.serializers.case_run import CaseRunsSerializer, CaseRunsTestplanSerializer
+from eqator_projects.services.project_data_factory import ProjectDataFactory
+from eqator_projects.tests.helpers.create_project_mixin import CreateProjectMixin
+from helpers.enums import UserProjectRoleEnum
+
+# несколько размеров, чтобы по отчёту было видно, как стоимость растёт с проектом
+BENCHMARK_SIZES = [int(size) for size in os.environ.get('BENCHMARK_SIZES', '1000,10000').split(',')]
+BENCHMARK_REPORT = os.environ.get('BENCHMARK_REPORT', 'benchmark_report.json')
+BENCHMARK_BASELINE = os.environ.get('BENCHMARK_BASELINE')
+# допустимый рост относительно baseline
+LATENCY_THRESHOLD = float(os.environ.get('BENCHMARK_LATENCY_THRESHOLD', '1.3'))
+MEMORY_THRESHOLD = float(os.environ.get('BENCHMARK_MEMORY_THRESHOLD', '1.3'))
+REPEATS = 3
+
+
+@tag('benchmark')
+@skipUnless(os.environ.get('BENCHMARK'), 'Set BENCHMARK=1 to run performance benchmarks')
+class ApiBenchmarkTestCase(CreateProjectMixin):
+    """
+    Замеры времени, количества запросов и пиковой памяти на больших проектах.
+    Размеры задаются через BENCHMARK_SIZES, отчёт пишется в BENCHMARK_REPORT
+    и сравнивается с BENCHMARK_BASELINE, если он указан.
+    """
+    report = {}
+
+    def setUp(self) -> None:
+        self._set_common_data()
+        self.project = self._create_project(self.project_data)
+        self.project.sites.set(self.sites)
+
+        qalead_role = UserProjectRole.objects.filter(
+            project=self.project, title=self.all_abac_roles[UserProjectRoleEnum.QALEAD]['title']).first()
+        UserProject.objects.create(user=self.user_qalead, project=self.project, abac_role=qalead_role)
+        self._authenticate(self.user_qalead)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with open(BENCHMARK_REPORT, 'w') as report_file:
+            json.dump(cls.report, report_file, indent=2, sort_keys=True)
+
+    def _populate(self, size):
+        data = ProjectDataFactory(self.project).generate(cases=size, auto_test_results=size)
+        return data['cases'], data['runs'][0], data['milestone'], data['auto_test_run']
+
+    def _measure(self, name, size, url, params=None):
+        # прогревочный запрос: кеши count, тегов и проекта заполняются до замеров
+        self.assertEqual(self.client.get(url, params).status_code, 200, msg=name)
+
+        timings, query_counts = [], []
+        for _ in range(REPEATS):
+            tracemalloc.start()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = self.client.get(url, params)
+                timings.append(time.perf_counter() - started)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.assertEqual(response.status_code, 200, msg=name)
+            query_counts.append(len(queries))
+
+        self.assertEqual(len(set(query_counts)), 1, msg=f'{name}[{size}]: queries differ between repeats {query_counts}')
+        self.report[f'{name}[{size}]'] = {
+            'latency': min(timings),
+            'queries': query_counts[0],
+            'peak_memory': peak,
+        }
+
+    def _measure_serializer(self, name, size, serializer_class, queryset):
+        # страница уже загружена, сравнивается только сериализация: стандартный ListSerializer и быстрый путь
+        rows = list(queryset)
+        variants = {
+            'stock': lambda: serializers.ListSerializer(rows, child=serializer_class()).data,
+            'fast': lambda: serializer_class(rows, many=True).data,
+        }
+        results = {}
+        for variant, serialize in variants.items():
+            results[variant] = serialize()
+            timings = []
+            for _ in range(REPEATS):
+                started = time.perf_counter()
+                serialize()
+                timings.append(time.perf_counter() - started)
+            self.report[f'{name}-{variant}[{size}]'] = {'latency': min(timings), 'queries': 0, 'peak_memory': 0}
+
+        self.assertEqual(results['fast'], results['stock'], msg=name)
+
+    def _check_baseline(self):
+        if not BENCHMARK_BASELINE:
+            return
+        with open(BENCHMARK_BASELINE) as baseline_file:
+            baseline = json.load(baseline_file)
+        for key, result in self.report.items():
+            if key not in baseline:
+                continue
+            expected = baseline[key]
+            with self.subTest(key):
+                self.assertLessEqual(result['queries'], expected['queries'])
+                self.assertLessEqual(result['latency'], expected['latency'] * LATENCY_THRESHOLD)
+                self.assertLessEqual(result['peak_memory'], expected['peak_memory'] * MEMORY_THRESHOLD)
+
+    def test_endpoints(self):
+        for size in BENCHMARK_SIZES:
+            cases, run, milestone, auto_test_run = self._populate(size)
+            middle = cases[size // 2]
+
+            self._measure('cases-list', size, reverse('cases-list'), {'project': self.project.id})
+            self._measure('cases-list-full', size, reverse('cases-list'),
+                          {'project': self.project.id, 'full_list': True})
+            self._measure('cases-get-next', size, reverse('cases-get-next', args=(middle.id,)))
+            self._measure('runs-cases', size, reverse('runs-cases', args=[run.id]))
+            self._measure('runs-steps-info', size, reverse('runs-steps-info'), {'model': 'milestone', 'id': milestone.id})
+            self._measure('runs-generate-cases-excel', size, reverse('runs-generate-cases-excel', args=[run.id]))
+            self._measure('projects-auto-test-runs', size, reverse('projects-auto-test-runs', args=[self.project.id]))
+            self._measure('projects-auto-test-runs-result', size,
+                          reverse('projects-auto-test-runs-result', args=[self.project.id, auto_test_run.id]))
+
+            case_runs = CaseRun.objects.filter(run=run).select_related('case', 'original_update_by')
+            self._measure_serializer('serialize-case-runs', size, CaseRunsSerializer, case_runs)
+            self._measure_serializer('serialize-case-runs-testplan', size, CaseRunsTestplanSerializer, case_runs)
+
+            CasePage.objects.filter(project=self.project).delete()
+            AutoTestRun.objects.filter(project=self.project).delete()
+            RunPage.objects.filter(project=self.project).delete()
+
+        self._check_baseline()
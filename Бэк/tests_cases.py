@@ -1,44 +1,60 @@
 import json
+import time
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.db import OperationalError, connection, connections
+from django.db.models import Exists, OuterRef
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from content.models.tags import Tags
 from eqator_projects.models.step import Step
 from rest_framework import status
 
+from eqator_projects import db_router
 from eqator_projects.models import CasePage, UserProject, UserProjectRole, TestPlan
-from eqator_projects.tests.helpers.create_project_mixin import CreateProjectMixin
+from eqator_projects.services import approximate_counts, case_ordering
+from eqator_projects.services.abac_permissions_service import abac_service
+from eqator_projects.services.project_cache import bump_project_version, project_caches
+from eqator_projects.services.request_metrics import RequestMetricsMiddleware, metrics_registry, render_prometheus
+from eqator_projects.tests.helpers.class_data_mixin import ClassDataProjectMixin
 from helpers.enums import UserProjectRoleEnum
 
 
-class CaseTestCase(CreateProjectMixin):
-    def setUp(self) -> None:
-        self._set_common_data()
-        self.project = self._create_project(self.project_data)
-        self.project.sites.set(self.sites)
-        self.other_project = self._create_project(self.project2_data)
-        self.other_project.sites.set(self.sites)
+class CaseTestCase(ClassDataProjectMixin):
+    @classmethod
+    def setUpTestData(cls):
+        cls._set_common_class_data()
+        cls.project = cls._create_class_project(cls.project_data)
+        cls.project.sites.set(cls.sites)
+        cls.other_project = cls._create_class_project(cls.project2_data)
+        cls.other_project.sites.set(cls.sites)
 
-        user_project_roles = UserProjectRole.objects.filter(project=self.project)
+        user_project_roles = UserProjectRole.objects.filter(project=cls.project)
         qalead_role = user_project_roles.filter(
-            title=self.all_abac_roles[UserProjectRoleEnum.QALEAD]['title']).first()
-        pm_role = user_project_roles.filter(title=self.all_abac_roles[UserProjectRoleEnum.PM]['title']).first()
-        qa_role = user_project_roles.filter(title=self.all_abac_roles[UserProjectRoleEnum.QA]['title']).first()
-        dev_role = user_project_roles.filter(title=self.all_abac_roles[UserProjectRoleEnum.DEV]['title']).first()
-
-        UserProject.objects.create(user=self.user_qa, project=self.project, abac_role=qa_role)
-        UserProject.objects.create(user=self.user_pm, project=self.project, abac_role=pm_role)
-        UserProject.objects.create(user=self.user_dev, project=self.project, abac_role=dev_role)
-        UserProject.objects.create(user=self.user_qalead, project=self.project, abac_role=qalead_role)
-
-        another_project_qa = UserProjectRole.objects.filter(project=self.other_project,
-                                                            title=self.all_abac_roles[UserProjectRoleEnum.QA][
+            title=cls.all_abac_roles[UserProjectRoleEnum.QALEAD]['title']).first()
+        pm_role = user_project_roles.filter(title=cls.all_abac_roles[UserProjectRoleEnum.PM]['title']).first()
+        qa_role = user_project_roles.filter(title=cls.all_abac_roles[UserProjectRoleEnum.QA]['title']).first()
+        dev_role = user_project_roles.filter(title=cls.all_abac_roles[UserProjectRoleEnum.DEV]['title']).first()
+
+        UserProject.objects.create(user=cls.user_qa, project=cls.project, abac_role=qa_role)
+        UserProject.objects.create(user=cls.user_pm, project=cls.project, abac_role=pm_role)
+        UserProject.objects.create(user=cls.user_dev, project=cls.project, abac_role=dev_role)
+        UserProject.objects.create(user=cls.user_qalead, project=cls.project, abac_role=qalead_role)
+
+        another_project_qa = UserProjectRole.objects.filter(project=cls.other_project,
+                                                            title=cls.all_abac_roles[UserProjectRoleEnum.QA][
                                                                 'title']).first()
-        UserProject.objects.create(user=self.user_other_project, project=self.other_project,
+        UserProject.objects.create(user=cls.user_other_project, project=cls.other_project,
                                    abac_role=another_project_qa)
 
-        self.casepage = CasePage.objects.create(project_id=self.project.id, title="Test_casepage",
-                                                priority=CasePage.Priority.LOW)
-        self.testplan = TestPlan.objects.create(project=self.project, integration_id=1)
-        self.testplan.cases.add(self.casepage)
-        self.testplan.save()
+        cls.casepage = CasePage.objects.create(project_id=cls.project.id, title="Test_casepage",
+                                               priority=CasePage.Priority.LOW)
+        cls.testplan = TestPlan.objects.create(project=cls.project, integration_id=1)
+        cls.testplan.cases.add(cls.casepage)
+        cls.testplan.save()
 
     @staticmethod
     def _generate_steps(count):
@@ -265,6 +281,223 @@ class CaseTestCase(CreateProjectMixin):
             self.assertEqual(response.status_code, 200, msg=f'Error with status {case_status}: {response.data}')
             self.assertEqual(expected_count, actual_count, msg=f'Expected {expected_count} results for status {case_status}, got {actual_count}.')
 
+    def test_steps_count(self):
+        Step.objects.bulk_create([Step(case=self.casepage, number=1), Step(case=self.casepage, number=2)])
+        self.casepage.refresh_from_db()
+        self.assertEqual(self.casepage.steps_count, 2)
+
+        Step.objects.create(case=self.casepage, number=3)
+        Step.objects.create(case=self.casepage, number=4)
+        with CaptureQueriesContext(connection) as queries:
+            Step.objects.filter(case=self.casepage, number__in=[1, 4]).delete()
+        self.casepage.refresh_from_db()
+        self.assertEqual(self.casepage.steps_count, 2)
+        # массовое удаление пересчитывает кейс одним UPDATE, без сдвигов по строкам
+        case_updates = [query for query in queries.captured_queries
+                        if query['sql'].startswith('UPDATE') and CasePage._meta.db_table in query['sql']]
+        self.assertEqual(len(case_updates), 1)
+
+        # полное сохранение устаревшего экземпляра не затирает счётчик
+        stale = CasePage.objects.get(pk=self.casepage.pk)
+        stale.steps_count = 0
+        stale.save()
+        self.casepage.refresh_from_db()
+        self.assertEqual(self.casepage.steps_count, 2)
+
+        # перенос шага в другой кейс через save()
+        other = CasePage.objects.create(project_id=self.project.id, title='Other')
+        step = Step.objects.get(case=self.casepage, number=3)
+        step.case = other
+        step.save()
+        self.casepage.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.casepage.steps_count, other.steps_count), (1, 1))
+
+        self._authenticate(self.user_qalead)
+        response = self.client.get(reverse('cases-list'), {'has_steps': True, 'project': self.project.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({case['id'] for case in response.json()['results']}, {self.casepage.id, other.id})
+
+    def test_tags_filter(self):
+        first, second = Tags.objects.create(title='First'), Tags.objects.create(title='Second')
+        both = CasePage.objects.create(project_id=self.project.id, title="Both_tags")
+        both.tags.add(first, second)
+        self.casepage.tags.add(first)
+
+        self._authenticate(self.user_qalead)
+        url = reverse('cases-list')
+        for mode, expected in (('or', {both.id, self.casepage.id}), ('and', {both.id})):
+            response = self.client.get(url, {'tags': [first.id, second.id], 'tags_mode': mode})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual({case['id'] for case in response.json()['results']}, expected, msg=mode)
+
+        # переименование тега видно в списке сразу, кеш тегов общий для процессов
+        with self.captureOnCommitCallbacks(execute=True):
+            first.title = 'Renamed'
+            first.save()
+        response = self.client.get(url, {'tags': [first.id], 'project': self.project.id})
+        titles = {tag['title'] for case in response.json()['results'] for tag in case['tags']}
+        self.assertIn('Renamed', titles)
+        self.assertNotIn('First', titles)
+
+    def test_list_count_exact(self):
+        CasePage.objects.create(project_id=self.project.id, title="Second_casepage")
+        self._authenticate(self.user_qalead)
+        url = reverse('cases-list')
+        response = self.client.get(url, {'project': self.project.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertTrue(response.data['count_exact'])
+
+        with mock.patch.object(approximate_counts, 'EXACT_COUNT_LIMIT', 1):
+            with self.captureOnCommitCallbacks(execute=True):
+                CasePage.objects.create(project_id=self.project.id, title="Third_casepage")
+            response = self.client.get(url, {'project': self.project.id})
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.data['count_exact'])
+            self.assertEqual(len(response.data['results']), 3)
+
+            # при приблизительном количестве следующая страница определяется по лишней строке
+            response = self.client.get(url, {'project': self.project.id, 'page_size': 2})
+            self.assertEqual(len(response.data['results']), 2)
+            self.assertIsNotNone(response.data['next'])
+            response = self.client.get(url, {'project': self.project.id, 'page_size': 2, 'page': 2})
+            self.assertEqual(len(response.data['results']), 1)
+            self.assertIsNone(response.data['next'])
+
+    def test_count_key_subquery_tables(self):
+        through = CasePage.tags.through
+        queryset = CasePage.objects.filter(project=self.project) \
+            .filter(Exists(through.objects.filter(casepage_id=OuterRef('pk'))))
+        key = approximate_counts._count_key(queryset)
+        # таблица тегов участвует только в подзапросе EXISTS
+        approximate_counts.bump_table_version(through._meta.db_table)
+        self.assertNotEqual(approximate_counts._count_key(queryset), key)
+
+    def test_list_compact_format(self):
+        self._authenticate(self.user_qalead)
+        response = self.client.get(reverse('cases-list'), {'project': self.project.id, 'format': 'compact'})
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)['results']
+        self.assertIn('id', results['columns'])
+        self.assertEqual(results['rows'][0][results['columns'].index('id')], self.casepage.id)
+
+    def test_project_cache(self):
+        bump_project_version(self.project.id)
+        project_caches.reset_stats()
+        ordering = project_caches.get('case_ordering', self.project.id)
+        self.assertEqual(ordering[self.casepage.suite_id], [self.casepage.id])
+        project_caches.get('case_ordering', self.project.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second = CasePage.objects.create(project_id=self.project.id, title="Second_casepage")
+        ordering = project_caches.get('case_ordering', self.project.id)
+        self.assertIn(second.id, ordering[second.suite_id])
+
+        stats = project_caches.stats()['caches']['case_ordering']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+        # переименование тега сбрасывает кеш тегов проектов, где он используется
+        tag = Tags.objects.create(title='Before')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.casepage.tags.add(tag)
+        self.assertIn('Before', {item['title'] for item in project_caches.get('tags', self.project.id)})
+        tag.title = 'After'
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+        self.assertIn('After', {item['title'] for item in project_caches.get('tags', self.project.id)})
+
+    def test_list_show_link_from_project_cache(self):
+        project_caches.reset_stats()
+        self._authenticate(self.user_qalead)
+        url = reverse('cases-list')
+        user_project = UserProject.objects.get(project=self.project, user=self.user_qalead)
+        expected = bool(abac_service.check_project_permissions(user_project, 'case', 'GET'))
+
+        for _ in range(2):
+            response = self.client.get(url, {'project': self.project.id})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['results'][0]['show_link'], expected)
+        stats = project_caches.stats()['caches']['abac_roles']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+        # смена роли участника сбрасывает кеш ролей проекта
+        qa_role = UserProjectRole.objects.get(
+            project=self.project, title=self.all_abac_roles[UserProjectRoleEnum.QA]['title'])
+        with self.captureOnCommitCallbacks(execute=True):
+            user_project.abac_role = qa_role
+            user_project.save()
+        response = self.client.get(url, {'project': self.project.id})
+        self.assertEqual(response.data['results'][0]['show_link'],
+                         bool(abac_service.check_project_permissions(user_project, 'case', 'GET')))
+        self.assertEqual(project_caches.stats()['caches']['abac_roles']['misses'], 2)
+
+    def test_list_not_modified(self):
+        self._authenticate(self.user_qalead)
+        url = reverse('cases-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # steps_count и теги меняются без updated_at кейса
+        with self.captureOnCommitCallbacks(execute=True):
+            Step.objects.create(case=self.casepage, number=1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.casepage.tags.add(Tags.objects.create(title='ETag tag'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        CasePage.objects.create(project_id=self.project.id, title="New_casepage")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Accept', response['Vary'])
+
+        # тот же URL в другом формате по Accept - другой ETag
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT='application/vnd.eqator.compact+json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_request_metrics(self):
+        self._authenticate(self.user_qalead)
+        metrics_registry.reset()
+        middleware = 'eqator_projects.services.request_metrics.RequestMetricsMiddleware'
+        with self.settings(MIDDLEWARE=[*settings.MIDDLEWARE, middleware]):
+            response = self.client.get(reverse('cases-list'), {'project': self.project.id})
+        self.assertEqual(response.status_code, 200)
+
+        metrics = metrics_registry.snapshot()['CasesView.list']
+        self.assertEqual(metrics['requests'], 1)
+        # COUNT страницы выполняется в потоке sync_to_async и тоже учитывается
+        self.assertGreaterEqual(metrics['queries_p50'], 2)
+        self.assertGreater(metrics['serialization_time_p50'], 0)
+
+        text = render_prometheus({'Cases"View.list': metrics})
+        self.assertIn('# TYPE request_metrics_queries gauge', text)
+        self.assertIn('request_metrics_requests_total{view="Cases\\"View",action="list"} 1', text)
+
+    def test_request_metrics_async(self):
+        metrics_registry.reset()
+
+        async def get_response(request):
+            request._metrics_view_key = 'AsyncView.list'
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics_registry.snapshot()['AsyncView.list']['requests'], 1)
+
     def test_get_next_prev_others(self):
         self._authenticate(self.user_qalead)
 
@@ -300,6 +533,59 @@ class CaseTestCase(CreateProjectMixin):
         self.assertEqual(response.status_code, 200)
         self.assertTrue(response.data['file'])
 
+    def test_reorder_cases(self):
+        self._authenticate(self.user_qalead)
+        second = CasePage.objects.create(project_id=self.project.id, title="Second_casepage")
+        third = CasePage.objects.create(project_id=self.project.id, title="Third_casepage")
+
+        url = reverse('cases-reorder')
+        response = self.client.post(url, {'cases': [third.id], 'before': self.casepage.id}, format='json')
+        self.assertEqual(response.status_code, 200, msg=response.data)
+
+        response = self.client.get(reverse('cases-get-next', args=(third.id,)))
+        self.assertEqual(response.data['id'], self.casepage.id)
+        response = self.client.get(reverse('cases-get-prev', args=(second.id,)))
+        self.assertEqual(response.data['id'], self.casepage.id)
+
+        response = self.client.post(url, {'cases': [third.id], 'before': third.id, 'after': second.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # перед первым кейсом сьюта ключи не уходят ниже нуля
+        CasePage.objects.filter(pk=self.casepage.pk).update(sort=1)
+        response = self.client.post(url, {'cases': [second.id, third.id], 'before': self.casepage.id}, format='json')
+        self.assertEqual(response.status_code, 200, msg=response.data)
+        self.assertTrue(all(case['sort'] >= 0 for case in response.data))
+        ordered = list(CasePage.objects.filter(id__in=[self.casepage.id, second.id, third.id])
+                       .order_by('sort', 'id').values_list('id', flat=True))
+        self.assertEqual(ordered, [second.id, third.id, self.casepage.id])
+
+        # блок больше шага перенумерации не помещается в зазор - сьют перенумеровывается вместе с ним
+        fourth = CasePage.objects.create(project_id=self.project.id, title="Fourth_casepage")
+        CasePage.objects.filter(pk=fourth.pk).update(sort=2)
+        with mock.patch.object(case_ordering, 'SORT_GAP', 2):
+            response = self.client.post(url, {'cases': [self.casepage.id, second.id, third.id],
+                                              'before': fourth.id}, format='json')
+        self.assertEqual(response.status_code, 200, msg=response.data)
+        ordered = list(CasePage.objects.filter(id__in=[self.casepage.id, second.id, third.id, fourth.id])
+                       .order_by('sort', 'id').values_list('id', flat=True))
+        self.assertEqual(ordered, [self.casepage.id, second.id, third.id, fourth.id])
+
+        # узкий зазор со стороны нижнего соседа тоже запускает фоновую перенумерацию
+        for case, case_sort in ((self.casepage, 100), (second, 103), (third, 200), (fourth, 300)):
+            CasePage.objects.filter(pk=case.pk).update(sort=case_sort)
+        with mock.patch.object(case_ordering, 'rebalance_suite_task') as rebalance_task, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'cases': [third.id], 'after': self.casepage.id}, format='json')
+        self.assertEqual(response.status_code, 200, msg=response.data)
+        rebalance_task.delay.assert_called_once()
+
+        # кейсы чужого проекта не находятся
+        sort = CasePage.objects.get(pk=third.pk).sort
+        self._authenticate(self.user_other_project)
+        response = self.client.post(url, {'cases': [third.id], 'after': fourth.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CasePage.objects.get(pk=third.pk).sort, sort)
+
     def test_clone_case(self):
         self._authenticate(self.user_qalead)
         before = CasePage.objects.count()
@@ -310,3 +596,59 @@ class CaseTestCase(CreateProjectMixin):
         self.assertEqual(response.status_code, 200)
         self.assertTrue(response.data)
         self.assertTrue(after > before)
+
+
+@skipUnless(db_router.REPLICA_ALIAS in settings.DATABASES, 'Нужна база реплики (TEST MIRROR на default)')
+class ReplicaReadTestCase(ClassDataProjectMixin):
+    databases = {'default', db_router.REPLICA_ALIAS}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls._set_common_class_data()
+        cls.project = cls._create_class_project(cls.project_data)
+        cls.project.sites.set(cls.sites)
+        qalead_role = UserProjectRole.objects.filter(
+            project=cls.project, title=cls.all_abac_roles[UserProjectRoleEnum.QALEAD]['title']).first()
+        UserProject.objects.create(user=cls.user_qalead, project=cls.project, abac_role=qalead_role)
+        cls.casepage = CasePage.objects.create(project_id=cls.project.id, title="Test_casepage")
+
+    def setUp(self) -> None:
+        super().setUp()
+        # реплика считается догнавшей основную базу до следующей проверки
+        db_router._lag_state.update(checked_at=time.monotonic(), lag=0.0)
+        self.addCleanup(db_router._lag_state.update, checked_at=0.0, lag=0.0)
+
+    def test_router(self):
+        self.assertEqual(CasePage.objects.all().db, 'default')
+        with db_router.use_replica():
+            self.assertEqual(CasePage.objects.all().db, db_router.REPLICA_ALIAS)
+            # запись всегда на основную базу
+            self.casepage.title = 'Renamed'
+            self.casepage.save()
+            self.assertEqual(self.casepage._state.db, 'default')
+
+    def test_replica_failure_falls_back_to_default(self):
+        self._authenticate(self.user_qalead)
+        url = reverse('cases-list')
+        replica = connections[db_router.REPLICA_ALIAS]
+        with mock.patch.object(replica, 'ensure_connection', side_effect=OperationalError('replica is down')) as down:
+            response = self.client.get(url, {'project': self.project.id})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([case['id'] for case in response.json()['results']], [self.casepage.id])
+            self.assertTrue(down.called)
+            self.assertEqual(db_router.get_replica_lag(), float('inf'))
+
+            # до следующей проверки отставания реплика не используется
+            down.reset_mock()
+            response = self.client.get(url, {'project': self.project.id})
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(down.called)
+
+    def test_sticky_after_write(self):
+        self._authenticate(self.user_qalead)
+        db_router.mark_user_write(self.user_qalead)
+        replica = connections[db_router.REPLICA_ALIAS]
+        with mock.patch.object(replica, 'ensure_connection', side_effect=OperationalError) as down:
+            response = self.client.get(reverse('cases-list'), {'project': self.project.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(down.called)
@@ -1,49 +1,70 @@
+import gzip
+import io
 import json
 
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
-from rest_framework import status
+from rest_framework import serializers, status
 
 from content.models.tags import Tags
-from eqator_projects.models import RunPage, CasePage, UserProject, UserProjectRole, MilestonePage, CaseRun
-from eqator_projects.tests.helpers.create_project_mixin import CreateProjectMixin
-from helpers.enums import UserProjectRoleEnum
+from eqator_projects.models import RunPage, CasePage, UserProject, UserProjectRole, MilestonePage, CaseRun, CaseRunStep, \
+    Comment
+from eqator_projects.models.eqator_report import EqatorFileState, EqatorTool
+from eqator_projects.models.step import Step
+from eqator_projects.serializers.case_run import CaseRunsSerializer, CaseRunsReportsSerializer, \
+    CaseRunsTestplanSerializer
+from eqator_projects.serializers.case_attachments import Attachment, attachments_field
+from eqator_projects.services.case_ordering import SORT_GAP
+from eqator_projects.services.case_run_counters import reconcile_counters
+from eqator_projects.services.case_run_status import get_run_progress
+from eqator_projects.services.case_run_sync import get_outdated_case_runs, sync_case_runs, sync_case_runs_task
+from eqator_projects.services.eqator_ingest import EQATOR_TOKEN_FIELD, LimitedStream, PARSE_ERRORS, ReportTooLarge, \
+    get_project_id_by_token, ingest_report
+from eqator_projects.services.milestone_reports import get_milestone_rollup
+from eqator_projects.services.project_data_factory import ProjectDataFactory
+from eqator_projects.tests.helpers.class_data_mixin import ClassDataProjectMixin
+from helpers.enums import UserProjectRoleEnum, CaseSyncModeEnum
 
 
-class RunsViewTestCase(CreateProjectMixin):
-    def setUp(self) -> None:
-        self._set_common_data()
-        self.project = self._create_project(self.project_data)
-        self.project.sites.set(self.sites)
-        self.other_project = self._create_project(self.project2_data)
-        self.other_project.sites.set(self.sites)
+class RunsViewTestCase(ClassDataProjectMixin):
+    @classmethod
+    def setUpTestData(cls):
+        cls._set_common_class_data()
+        cls.project = cls._create_class_project(cls.project_data)
+        cls.project.sites.set(cls.sites)
+        cls.other_project = cls._create_class_project(cls.project2_data)
+        cls.other_project.sites.set(cls.sites)
 
-        user_project_roles = UserProjectRole.objects.filter(project=self.project)
+        user_project_roles = UserProjectRole.objects.filter(project=cls.project)
         qalead_role = user_project_roles.filter(
-            title=self.all_abac_roles[UserProjectRoleEnum.QALEAD]['title']).first()
-        pm_role = user_project_roles.filter(title=self.all_abac_roles[UserProjectRoleEnum.PM]['title']).first()
-        qa_role = user_project_roles.filter(title=self.all_abac_roles[UserProjectRoleEnum.QA]['title']).first()
-        dev_role = user_project_roles.filter(title=self.all_abac_roles[UserProjectRoleEnum.DEV]['title']).first()
-
-        self.up_qa = UserProject.objects.create(user=self.user_qa, project=self.project, abac_role=qa_role)
-        self.up_pm = UserProject.objects.create(user=self.user_pm, project=self.project, abac_role=pm_role)
-        self.up_dev = UserProject.objects.create(user=self.user_dev, project=self.project, abac_role=dev_role)
-        self.up_qalead = UserProject.objects.create(user=self.user_qalead, project=self.project, abac_role=qalead_role)
-
-        another_project_qa = UserProjectRole.objects.filter(project=self.other_project,
-                                                            title=self.all_abac_roles[UserProjectRoleEnum.QA][
+            title=cls.all_abac_roles[UserProjectRoleEnum.QALEAD]['title']).first()
+        pm_role = user_project_roles.filter(title=cls.all_abac_roles[UserProjectRoleEnum.PM]['title']).first()
+        qa_role = user_project_roles.filter(title=cls.all_abac_roles[UserProjectRoleEnum.QA]['title']).first()
+        dev_role = user_project_roles.filter(title=cls.all_abac_roles[UserProjectRoleEnum.DEV]['title']).first()
+
+        cls.up_qa = UserProject.objects.create(user=cls.user_qa, project=cls.project, abac_role=qa_role)
+        cls.up_pm = UserProject.objects.create(user=cls.user_pm, project=cls.project, abac_role=pm_role)
+        cls.up_dev = UserProject.objects.create(user=cls.user_dev, project=cls.project, abac_role=dev_role)
+        cls.up_qalead = UserProject.objects.create(user=cls.user_qalead, project=cls.project, abac_role=qalead_role)
+
+        another_project_qa = UserProjectRole.objects.filter(project=cls.other_project,
+                                                            title=cls.all_abac_roles[UserProjectRoleEnum.QA][
                                                                 'title']).first()
-        UserProject.objects.create(user=self.user_other_project, project=self.other_project,
+        UserProject.objects.create(user=cls.user_other_project, project=cls.other_project,
                                    abac_role=another_project_qa)
 
-        self.tag = Tags.objects.create(title='Test Tag 1')
-        self.casepage = CasePage.objects.create(project_id=self.project.id, title="Test",
-                                                priority=CasePage.Priority.LOW, status=CasePage.STATUS.APPROVED)
-        self.casepage.tags.add(self.tag)
-        self.milestone = MilestonePage.objects.create(project=self.project, title="Test Milestone")
-        self.runpage = RunPage.objects.create(project=self.project, title="Test Run", milestone=self.milestone, assigned_to=self.up_dev)
-        self.case_run = CaseRun.objects.create(run=self.runpage, case=self.casepage, status=CaseRun.CaseStatus.UNTESTED)
+        cls.tag = Tags.objects.create(title='Test Tag 1')
+        cls.casepage = CasePage.objects.create(project_id=cls.project.id, title="Test",
+                                               priority=CasePage.Priority.LOW, status=CasePage.STATUS.APPROVED)
+        cls.casepage.tags.add(cls.tag)
+        cls.milestone = MilestonePage.objects.create(project=cls.project, title="Test Milestone")
+        cls.runpage = RunPage.objects.create(project=cls.project, title="Test Run", milestone=cls.milestone, assigned_to=cls.up_dev)
+        cls.case_run = CaseRun.objects.create(run=cls.runpage, case=cls.casepage, status=CaseRun.CaseStatus.UNTESTED)
 
     def test_create_run(self):
         self._authenticate(self.user_qalead)
@@ -168,9 +189,243 @@ class RunsViewTestCase(CreateProjectMixin):
         self.case_run.refresh_from_db()
         self.assertEqual(self.case_run.status, CaseRun.CaseStatus.PASSED)
 
+    def test_change_status_batch(self):
+        self._authenticate(self.user_qa)
+        step = CaseRunStep.objects.create(case_run=self.case_run, number=1, description='', expected_result='')
+        url = reverse('runs-change-status-batch', args=[self.runpage.id])
+        data = {
+            "items": [
+                {"case_run": self.case_run.id, "status": CaseRun.CaseStatus.PASSED, "comment": "ok"},
+                {"case_run": self.case_run.id, "step": step.id, "status": CaseRun.CaseStatus.PASSED},
+            ]
+        }
+        response = self.client.post(url, data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['progress'][CaseRun.CaseStatus.PASSED], 1)
+        self.runpage.refresh_from_db()
+        self.assertEqual(self.runpage.progress[CaseRun.CaseStatus.PASSED], 1)
+        self.case_run.refresh_from_db()
+        step.refresh_from_db()
+        self.assertEqual(self.case_run.status, CaseRun.CaseStatus.PASSED)
+        self.assertEqual(step.status, CaseRun.CaseStatus.PASSED)
+
+        data = {"items": [{"case_run": self.case_run.id, "status": CaseRun.CaseStatus.UNTESTED, "comment": "no"}]}
+        response = self.client.post(url, data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        data = {"items": [{"case_run": 999, "status": CaseRun.CaseStatus.PASSED}]}
+        response = self.client.post(url, data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_generate_cases_excel(self):
         self._authenticate(self.user_qalead)
         url = reverse('runs-generate-cases-excel', args=[self.runpage.id])
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+    def test_bulk_sync_case_runs(self):
+        Step.objects.bulk_create([
+            Step(case=self.casepage, number=1, description='new', expected_result=''),
+            Step(case=self.casepage, number=2, description='added', expected_result=''),
+        ])
+        CaseRunStep.objects.bulk_create([
+            CaseRunStep(case_run=self.case_run, number=1, description='old', expected_result=''),
+            CaseRunStep(case_run=self.case_run, number=3, description='removed', expected_result=''),
+        ])
+        CaseRun.objects.filter(pk=self.case_run.pk).update(needs_update=True)
+
+        expected = {'case_runs': 1, 'steps_updated': 1, 'steps_created': 1, 'steps_deleted': 1}
+        report = sync_case_runs(get_outdated_case_runs(milestone=self.milestone), CaseSyncModeEnum.RESET_STATUSES,
+                                dry_run=True)
+        self.assertEqual(report, expected)
+        self.assertEqual(CaseRunStep.objects.filter(case_run=self.case_run, description='old').count(), 1)
+
+        # несуществующий прогон не превращается в синхронизацию всех устаревших прогонов
+        self.assertIsNone(sync_case_runs_task(CaseSyncModeEnum.RESET_STATUSES, run_id=self.runpage.id + 1000))
+        self.assertTrue(get_outdated_case_runs(run=self.runpage).exists())
+
+        report = sync_case_runs(get_outdated_case_runs(run=self.runpage), CaseSyncModeEnum.RESET_STATUSES)
+        self.assertEqual(report, expected)
+        self.case_run.refresh_from_db()
+        self.assertFalse(self.case_run.needs_update)
+        self.assertEqual(self.case_run.code, self.casepage.slug)
+        self.assertEqual(
+            list(CaseRunStep.objects.filter(case_run=self.case_run).order_by('number').values_list('description', flat=True)),
+            ['new', 'added']
+        )
+        self.assertFalse(get_outdated_case_runs(run=self.runpage).exists())
+
+    def test_list_serializers_parity(self):
+        self.case_run.tags.add(self.tag)
+        CaseRun.objects.create(run=self.runpage, case=self.casepage, status=CaseRun.CaseStatus.PASSED)
+        queryset = CaseRun.objects.filter(run=self.runpage).select_related('case', 'run__milestone')
+        for serializer_class in (CaseRunsSerializer, CaseRunsReportsSerializer, CaseRunsTestplanSerializer):
+            expected = [serializer_class(case_run).data for case_run in queryset]
+            stock = serializers.ListSerializer(queryset, child=serializer_class()).data
+            self.assertEqual(serializer_class(queryset, many=True).data, expected, msg=serializer_class.__name__)
+            self.assertEqual(serializer_class(queryset, many=True).data, stock, msg=serializer_class.__name__)
+
+        # теги всей страницы - один запрос к промежуточной таблице
+        rows = list(queryset)
+        through_table = CaseRun.tags.through._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            data = CaseRunsSerializer(rows, many=True).data
+        self.assertEqual(sum(through_table in query['sql'] for query in queries.captured_queries), 1)
+        self.assertIn(self.tag.id, {tag['id'] for row in data for tag in row['tags']})
+
+    def test_project_data_factory(self):
+        data = ProjectDataFactory(self.other_project, seed=1).generate(cases=50, suites=3, steps_per_case=2, tags=4)
+        self.assertEqual(CasePage.objects.filter(project=self.other_project).count(), 50)
+        self.assertEqual(Step.objects.filter(case__project=self.other_project).count(), 100)
+        self.assertEqual(CaseRunStep.objects.filter(case_run__run=data['runs'][0]).count(), 100)
+        priorities = [case.priority for case in data['cases']]
+
+        # кейсы вставлены пачками в обе таблицы наследования и читаются как обычные страницы
+        case = CasePage.objects.get(pk=data['cases'][0].pk)
+        self.assertEqual((case.title, case.steps_count, case.level), (data['cases'][0].title, 2, 0))
+        sorts = sorted(CasePage.objects.filter(project=self.other_project).values_list('sort', flat=True))
+        self.assertTrue(all(sort % SORT_GAP == 0 for sort in sorts))
+        data['runs'][0].refresh_from_db()
+        self.assertEqual(data['runs'][0].progress, get_run_progress(data['runs'][0]))
+
+        other = ProjectDataFactory(self.other_project, seed=1).generate(cases=50, suites=3, steps_per_case=2, tags=4)
+        self.assertEqual([case.priority for case in other['cases']], priorities)
+
+    def test_generate_project_data_command(self):
+        out = io.StringIO()
+        call_command('generate_project_data', self.other_project.id, '--cases', '5', '--suites', '2', '--steps', '2',
+                     '--tags', '2', '--auto-test-results', '3', stdout=out)
+        self.assertIn('5', out.getvalue())
+        cases = CasePage.objects.filter(project=self.other_project)
+        self.assertEqual(cases.count(), 5)
+        self.assertEqual(Step.objects.filter(case__in=cases).count(), 10)
+        self.assertEqual(CaseRun.objects.filter(case__in=cases).count(), 5)
+
+    def test_case_run_counters(self):
+        step = CaseRunStep.objects.create(case_run=self.case_run, number=1, description='', expected_result='')
+
+        def counters():
+            self.case_run.refresh_from_db()
+            step.refresh_from_db()
+            return self.case_run.comments_count, step.comments_count
+
+        comment = Comment.objects.create(case_run=self.case_run, user=self.user_qa)
+        Comment.objects.create(case_run=self.case_run, case_run_step=step, user=self.user_qa)
+        self.assertEqual(counters(), (1, 1))
+
+        # перенос комментария на шаг
+        comment.case_run_step = step
+        comment.save()
+        self.assertEqual(counters(), (0, 2))
+
+        comment.delete()
+        self.assertEqual(counters(), (0, 1))
+
+        # комментарий, созданный до появления счётчиков, не уводит счётчик ниже нуля
+        CaseRunStep.objects.filter(pk=step.pk).update(comments_count=0)
+        Comment.objects.filter(case_run_step=step).delete()
+        self.assertEqual(counters(), (0, 0))
+
+        Comment.objects.create(case_run=self.case_run, user=self.user_qa)
+        CaseRun.objects.filter(pk=self.case_run.pk).update(comments_count=5)
+        CaseRunStep.objects.filter(pk=step.pk).update(comments_count=3)
+        reconcile_counters(CaseRun.objects.filter(pk=self.case_run.pk))
+        self.assertEqual(counters(), (1, 0))
+
+    def test_attachments_summary(self):
+        def summary():
+            self.casepage.refresh_from_db()
+            return self.casepage.attachments_count, self.casepage.attachments_preview
+
+        first = Attachment.objects.create(file=SimpleUploadedFile('first.txt', b'first'))
+        second = Attachment.objects.create(file=SimpleUploadedFile('second.txt', b'second'))
+        self.casepage.attachments.add(first, second)
+        self.assertEqual(summary(), (2, first.file.name))
+
+        data = CaseRunsSerializer(self.case_run).data
+        self.assertEqual(data['files_summary']['count'], 2)
+        self.assertNotIn('files', data)
+
+        # полный список вложений - отдельным действием прогона
+        self._authenticate(self.user_qalead)
+        response = self.client.get(reverse('runs-attachments', args=[self.runpage.id]), {'case_runs': [self.case_run.id]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data[self.case_run.id]), 2)
+
+        # удаление вложения каскадом удаляет связь без m2m_changed
+        first.delete()
+        self.assertEqual(summary(), (1, second.file.name))
+
+        # очистка со стороны вложения приходит без pk_set
+        getattr(second, attachments_field.remote_field.get_accessor_name()).clear()
+        self.assertEqual(summary(), (0, ''))
+
+    def test_milestone_rollup(self):
+        rollup = get_milestone_rollup(self.milestone)
+        self.assertEqual(rollup['count'], 1)
+        self.assertEqual(rollup['statuses'], {CaseRun.CaseStatus.UNTESTED: 1})
+        self.assertEqual(rollup['dimensions']['tag'][0]['count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.case_run.status = CaseRun.CaseStatus.PASSED
+            self.case_run.save()
+        rollup = get_milestone_rollup(self.milestone)
+        self.assertEqual(rollup['statuses'], {CaseRun.CaseStatus.PASSED: 1})
+
+        # теги прогона кейса и исполнитель прогона меняются без сохранения CaseRun
+        with self.captureOnCommitCallbacks(execute=True):
+            self.case_run.tags.clear()
+        self.assertEqual(get_milestone_rollup(self.milestone)['dimensions']['tag'][0]['value'], None)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.runpage.assigned_to = self.up_qa
+            self.runpage.save()
+        self.assertEqual(get_milestone_rollup(self.milestone)['dimensions']['assignee'][0]['value'], self.user_qa.id)
+
+    def test_eqator_ingest_diff(self):
+        first = ingest_report(self.project.id, EqatorTool.FLAKE8, io.BytesIO(
+            b'app/a.py:1:1: E501 line too long\napp/b.py:2:1: F401 unused import\n'), branch='main')
+        self.assertEqual((first.files_count, first.changed_count), (2, 2))
+
+        second = ingest_report(self.project.id, EqatorTool.FLAKE8, io.BytesIO(
+            b'app/a.py:1:1: E501 line too long\napp/c.py:3:1: W291 trailing whitespace\n'), branch='main')
+        self.assertEqual((second.files_count, second.changed_count), (2, 2))
+        self.assertEqual(
+            set(second.file_metrics.values_list('path', 'removed')), {('app/c.py', False), ('app/b.py', True)}
+        )
+        self.assertEqual(set(EqatorFileState.objects.filter(project=self.project, branch='main')
+                             .values_list('path', flat=True)), {'app/a.py', 'app/c.py'})
+
+    def test_eqator_ingest_limits(self):
+        # размер сжатого отчёта проверяется после распаковки, по мере чтения
+        bomb = gzip.compress(b'app/a.py:1:1: E501 line too long\n' * 10000)
+        stream = LimitedStream(gzip.GzipFile(fileobj=io.BytesIO(bomb)), 1024)
+        with self.assertRaises(ReportTooLarge):
+            ingest_report(self.project.id, EqatorTool.FLAKE8, stream, branch='limits')
+
+        # сущности XML не раскрываются
+        xml = (b'<?xml version="1.0"?><!DOCTYPE t [<!ENTITY a "aaaaaaaaaa"><!ENTITY b "&a;&a;&a;&a;">]>'
+               b'<testsuite><testcase classname="app.tests.T" name="&b;"/></testsuite>')
+        with self.assertRaises(PARSE_ERRORS):
+            ingest_report(self.project.id, EqatorTool.UNITTEST, io.BytesIO(xml), branch='limits')
+
+        # обрезанный gzip
+        truncated = gzip.compress(b'app/a.py:1:1: E501 line too long\n' * 100)[:-12]
+        with self.assertRaises(PARSE_ERRORS):
+            ingest_report(self.project.id, EqatorTool.FLAKE8, gzip.GzipFile(fileobj=io.BytesIO(truncated)),
+                          branch='limits')
+
+        # JSON не той формы
+        for tool, report in ((EqatorTool.COVERAGE, {'files': {'app/a.py': 'oops'}}),
+                             (EqatorTool.BANDIT, {'results': [1]})):
+            with self.subTest(tool), self.assertRaises(PARSE_ERRORS):
+                ingest_report(self.project.id, tool, io.BytesIO(json.dumps(report).encode()), branch='limits')
+
+    def test_eqator_token_cache(self):
+        token = 'new-eqator-token'
+        # токен пробовали до того, как он появился у проекта - закеширован как неверный
+        self.assertIsNone(get_project_id_by_token(token))
+        setattr(self.project, EQATOR_TOKEN_FIELD, token)
+        self.project.save()
+        self.assertEqual(get_project_id_by_token(token), self.project.id)
@@ -29,7 +29,8 @@ const AutotestsRuns = (): React.ReactElement => {
   const {
     data: autotestsRuns,
     isLoading,
-    error
+    error,
+    mutate
   } = useSWR(
     {
       projectId,
@@ -38,9 +39,43 @@ const AutotestsRuns = (): React.ReactElement => {
       q: debounceSearch !== '' ? debounceSearch : undefined,
       stateName: status !== '' ? status : undefined
     },
-    api.getAutotestsRuns
+    api.getAutotestsRuns,
+    { revalidateOnFocus: false }
   )
 
+  // mutate меняется вместе со страницей и фильтрами, поток событий при этом не переоткрывается
+  const mutateRef = React.useRef(mutate)
+  mutateRef.current = mutate
+
+  React.useEffect(() => {
+    const events = new EventSource(api.getProjectEventsUrl(projectId), {
+      withCredentials: true
+    })
+
+    events.addEventListener('autotest_run_state', (e: MessageEvent) => {
+      const delta = JSON.parse(e.data)
+      void mutateRef.current(
+        (current) =>
+          current !== undefined
+            ? {
+                ...current,
+                results: current.results.map((run) =>
+                  run.id === delta.id ? { ...run, ...delta } : run
+                )
+              }
+            : current,
+        { revalidate: false }
+      )
+    })
+    events.addEventListener('autotest_run_created', () => {
+      void mutateRef.current()
+    })
+
+    return () => {
+      events.close()
+    }
+  }, [projectId])
+
   const handleSearch = (value): void => {
     setSearch(value)
   }
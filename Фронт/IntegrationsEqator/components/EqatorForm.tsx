@@ -82,6 +82,10 @@ const EqatorForm = (): JSX.Element => {
               <div className={style.link}>
                 {tokenLink}
               </div>
+              <FormattedMessage
+                id='integrations.eqator.upload_hint'
+                defaultMessage='Send each report with the tool, branch and commit parameters, e.g. ?tool=coverage&branch=main&commit=SHA. Reports can be gzip-compressed; only files changed since the previous report of the branch are stored.'
+              />
             </div>
           </div>
           <div className={style.btns}>
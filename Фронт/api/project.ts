@@ -0,0 +1,5 @@
+
+  // EventSource не ходит через axios, поэтому адрес собирается из baseURL клиента
+  getProjectEventsUrl = (projectId: number): string => {
+    return `${this.ax.defaults.baseURL ?? ''}/project/${projectId}/events/`
+  }